@@ -0,0 +1,214 @@
+"""
+Frequent itemsets and association rules
+
+Python counterpart of the java Apriori (src/frequentPattern/Apriori.java).
+Every item keeps the set of transactions containing it as a bitmap, the
+support of an itemset is the popcount of the AND of its items' bitmaps.
+Itemsets are grown depth-first (Eclat): each prefix is intersected with all
+of its possible extensions in one vectorized step. The large sets are then
+printed level by level, in the same format and order as the java program.
+"""
+import os
+import sys
+import math
+import argparse
+from itertools import chain, combinations
+import numpy as np
+#
+# make the shared helpers of the repository root importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import cli
+
+
+def path_input_file():
+    file_dir = os.path.dirname(__file__)
+    return file_dir + "/transactions.txt"
+
+
+def read_transactions(path, separator=None):
+    #
+    # one transaction per line, items separated by separator (any whitespace by default)
+    # items are integers when every one of them is, strings otherwise
+    with open(path, 'rt', encoding='utf8') as f:
+        lines = f.read().splitlines()
+    if separator is None:
+        transactions = [line.split() for line in lines]
+    else:
+        transactions = [[item.strip() for item in line.split(separator) if item.strip()] for line in lines]
+    try:
+        return [list(map(int, transaction)) for transaction in transactions]
+    except ValueError:
+        return transactions
+
+
+def encode_transactions(transactions, min_support=1):
+    #
+    # vertical layout of the transactions : sorted values of the items contained in at least min_support
+    # transactions (a count) and one bitmap row per such item, infrequent items never get a row
+    # bit t of row i is set when transaction t contains item i, rows are uint64 words
+    n_transactions = len(transactions)
+    lengths = np.fromiter(map(len, transactions), dtype=np.int64, count=n_transactions)
+    flat = np.array(list(chain.from_iterable(transactions)))
+    values = np.unique(flat)
+    #
+    # (item, transaction) keys sorted item by item, an item repeated inside a transaction is counted once
+    keys = np.searchsorted(values, flat) * n_transactions + np.repeat(np.arange(n_transactions), lengths)
+    keys = np.sort(keys, kind='stable')
+    keys = keys[np.diff(keys, prepend=-1) != 0]
+    items, tids = np.divmod(keys, n_transactions)
+    frequent = np.bincount(items, minlength=len(values)) >= min_support
+    keep = frequent[items]
+    items, tids = (np.cumsum(frequent) - 1)[items[keep]], tids[keep]
+    #
+    # the bits of every (item, byte) cell are summed straight into the uint8 bitmaps, distinct bits of a
+    # byte never carry so the sum is their or, and the cells are already grouped by the sorted keys
+    n_bytes = max(1, (n_transactions + 63) // 64) * 8
+    bitmaps = np.zeros((int(frequent.sum()), n_bytes), dtype=np.uint8)
+    if len(items):
+        cells = items * n_bytes + (tids >> 3)
+        starts = np.flatnonzero(np.concatenate([[True], cells[1:] != cells[:-1]]))
+        bits = np.left_shift(1, tids & 7).astype(np.uint8)
+        bitmaps.ravel()[cells[starts]] = np.add.reduceat(bits, starts)
+    return values[frequent].tolist(), bitmaps.view(np.uint64)
+
+
+_byte_counts = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.int64)
+
+
+def popcount(bitmaps):
+    #
+    # number of set bits of every row
+    bitmaps = np.atleast_2d(bitmaps)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(bitmaps).sum(axis=1, dtype=np.int64)
+    return _byte_counts[bitmaps.view(np.uint8)].sum(axis=1)
+
+
+def min_count(min_support, n_transactions):
+    #
+    # an integer min_support is a transaction count, a fraction is relative to the number of transactions
+    if isinstance(min_support, float) and min_support < 1:
+        return max(1, int(math.ceil(min_support * n_transactions)))
+    return int(min_support)
+
+
+def frequent_itemsets(values, bitmaps, min_support):
+    #
+    # all itemsets contained in at least min_support transactions (a count, see min_count)
+    # returns {tuple of item values (sorted): count}
+    counts = popcount(bitmaps)
+    frequent = np.flatnonzero(counts >= min_support)
+    found = dict(((values[i],), int(counts[i])) for i in frequent)
+    #
+    # depth-first : (prefix codes, prefix bitmap, candidate codes after the prefix)
+    stack = [((i,), bitmaps[i], frequent[frequent > i]) for i in frequent[::-1]]
+    while stack:
+        prefix, prefix_bitmap, candidates = stack.pop()
+        if len(candidates) == 0:
+            continue
+        joined = np.bitwise_and(bitmaps[candidates], prefix_bitmap)
+        counts = popcount(joined)
+        keep = counts >= min_support
+        extensions = candidates[keep]
+        joined, counts = joined[keep], counts[keep]
+        for j in range(len(extensions) - 1, -1, -1):
+            itemset = prefix + (extensions[j],)
+            found[tuple(values[i] for i in itemset)] = int(counts[j])
+            stack.append((itemset, joined[j], extensions[j + 1:]))
+    return found
+
+
+def large_sets(itemsets):
+    #
+    # itemsets grouped by size, each level sorted like the java output
+    levels = {}
+    for itemset, count in itemsets.items():
+        levels.setdefault(len(itemset), []).append((itemset, count))
+    return [sorted(levels[size]) for size in sorted(levels)]
+
+
+def association_rules(itemsets, n_transactions, min_confidence=0.0):
+    #
+    # rules antecedent => consequent of every frequent itemset, with their support (fraction of the
+    # transactions), confidence and lift, sorted by decreasing confidence then lift
+    # every subset of a frequent itemset is frequent, so all counts are already in itemsets
+    rules = []
+    for itemset, count in itemsets.items():
+        for size in range(1, len(itemset)):
+            for antecedent in combinations(itemset, size):
+                consequent = tuple(item for item in itemset if item not in antecedent)
+                confidence = count / float(itemsets[antecedent])
+                if confidence < min_confidence:
+                    continue
+                lift = confidence / (itemsets[consequent] / float(n_transactions))
+                rules.append({'antecedent': antecedent, 'consequent': consequent,
+                              'support': count / float(n_transactions), 'confidence': confidence, 'lift': lift})
+    rules.sort(key=lambda rule: (-rule['confidence'], -rule['lift'], rule['antecedent'], rule['consequent']))
+    return rules
+
+
+def itemset_text(itemset):
+    return "".join("I" + str(item) for item in itemset)
+
+
+def print_database(transactions):
+    values = np.unique(np.array(list(chain.from_iterable(transactions)))).tolist()
+    print("*************** Input Database *******************")
+    print("Items symbolTable = {" + ",".join("I" + str(value) for value in values) + "}\n")
+    print("TransactionID      ItemSet")
+    print("--------------------------")
+    for tid, transaction in enumerate(transactions):
+        print("     T" + str(tid) + "            " + ",".join("I" + str(item) for item in transaction))
+    print("**************************************************")
+    print()
+
+
+def print_large_sets(levels):
+    print("*********** Frequent ItemSet Table ***************")
+    for index, level in enumerate(levels):
+        print("LargeSet No " + str(index) + " = {" +
+              ",".join("{" + itemset_text(itemset) + "}=>cnt:" + str(count) for itemset, count in level) + "}")
+
+
+def print_rules(rules):
+    print()
+    print("*********** Association Rules ********************")
+    for rule in rules:
+        print("{%s} => {%s}  support:%.3f  confidence:%.3f  lift:%.3f" % (
+            itemset_text(rule['antecedent']), itemset_text(rule['consequent']),
+            rule['support'], rule['confidence'], rule['lift']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Frequent itemsets (Eclat over transaction bitmaps) and rules")
+    parser.add_argument('path', nargs='?', help="transaction file, one transaction per line (default: bundled)")
+    parser.add_argument('--separator', help="item separator (default: any whitespace)")
+    parser.add_argument('--min-support', type=float, default=2,
+                        help="transaction count, or a fraction of the transactions when below 1")
+    parser.add_argument('--min-confidence', type=float, help="also derive association rules")
+    parser.add_argument('--quiet', action='store_true', help="do not print the input database")
+    parser.add_argument('--json', help="write the results as json to this file ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    transactions = read_transactions(args.path or path_input_file(), args.separator)
+    min_support = min_count(args.min_support if args.min_support < 1 else int(args.min_support), len(transactions))
+    values, bitmaps = encode_transactions(transactions, min_support)
+    itemsets = frequent_itemsets(values, bitmaps, min_support)
+    levels = large_sets(itemsets)
+    rules = None
+    if args.min_confidence is not None:
+        rules = association_rules(itemsets, len(transactions), args.min_confidence)
+    if args.json:
+        cli.write_json({'large_sets': [[{'itemset': list(itemset), 'count': count} for itemset, count in level]
+                                       for level in levels],
+                        'rules': rules}, args.json)
+        return
+    if not args.quiet:
+        print_database(transactions)
+    print_large_sets(levels)
+    if rules is not None:
+        print_rules(rules)
+
+
+if __name__ == '__main__':
+    main()
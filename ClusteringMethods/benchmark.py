@@ -0,0 +1,146 @@
+"""
+Scalability benchmark of the clustering comparison
+
+Every algorithm of clustering_setup is fitted on every dataset for a sweep
+of sample sizes, several times each. Fit times come from time.perf_counter,
+peak memory from one extra tracemalloc run per cell (numpy buffers are
+traced too). Results are written as json and can be compared against a
+stored baseline to flag regressions.
+
+    python benchmark.py --sizes 1000 10000 --repeats 3 --output results.json
+    python benchmark.py --sizes 1000 10000 --baseline results.json
+"""
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import warnings
+
+import numpy as np
+
+from clustering_setup import clustering_names, dataset_names, make_datasets, prepare, \
+    make_estimator, fit_input
+
+#
+#   largest n_samples run per algorithm, affinity propagation keeps several n x n float64 matrices
+#   (about 1.8 GB each at n=15000), larger cells are skipped unless the caps are disabled
+max_samples = {'AffinityPropagation': 5000}
+
+
+def fit_once(algorithm_index, X, trace_memory=False):
+    #
+    #   fit a fresh estimator, returns (seconds, peak traced bytes or None)
+    #   the estimator and its neighbor graph are built outside of the timed section, like in the comparison plot
+    name = clustering_names[algorithm_index]
+    algorithm = make_estimator(name, X)
+    data = fit_input(name, X)
+    if trace_memory:
+        tracemalloc.start()
+    t0 = time.perf_counter()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        algorithm.fit(data)
+    t1 = time.perf_counter()
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return t1 - t0, peak
+
+
+def run_benchmark(sizes, repeats=3, algorithms=None, datasets=None, measure_memory=True, random_state=0,
+                  caps=None, on_record=None):
+    #
+    #   one record per (n_samples, dataset, algorithm) with every repeat time and the peak memory
+    #   @algorithms / @datasets = names to restrict the sweep to, all of them when None
+    #   @caps = {algorithm: largest n_samples}, max_samples by default, {} to run every cell
+    #   @on_record = called with every record as soon as it is measured
+    caps = max_samples if caps is None else caps
+    algorithms = algorithms or clustering_names
+    datasets = datasets or dataset_names
+    records = []
+    for n_samples in sizes:
+        generated = make_datasets(n_samples, random_state=random_state)
+        for dataset_name in datasets:
+            X, _ = prepare(generated[dataset_names.index(dataset_name)])
+            for name in algorithms:
+                if n_samples > caps.get(name, n_samples):
+                    continue
+                algorithm_index = clustering_names.index(name)
+                times = [fit_once(algorithm_index, X)[0] for _ in range(repeats)]
+                peak = fit_once(algorithm_index, X, trace_memory=True)[1] if measure_memory else None
+                records.append({'n_samples': n_samples, 'dataset': dataset_name, 'algorithm': name,
+                                'times': times, 'median_time': float(np.median(times)),
+                                'min_time': float(np.min(times)), 'peak_memory': peak})
+                if on_record is not None:
+                    on_record(records[-1])
+    return records
+
+
+def _key(record):
+    return record['n_samples'], record['dataset'], record['algorithm']
+
+
+def compare(records, baseline, time_tolerance=0.25, memory_tolerance=0.25, min_time=0.01):
+    #
+    #   regressions of records against a baseline run : median time or peak memory grew by more than
+    #   the tolerance (as a fraction), cells faster than min_time seconds in both runs are ignored
+    previous = dict((_key(record), record) for record in baseline)
+    regressions = []
+    for record in records:
+        old = previous.get(_key(record))
+        if old is None:
+            continue
+        slower = record['median_time'] > old['median_time'] * (1 + time_tolerance)
+        if slower and max(record['median_time'], old['median_time']) >= min_time:
+            regressions.append(dict(zip(('n_samples', 'dataset', 'algorithm'), _key(record)),
+                                    measure='median_time', baseline=old['median_time'],
+                                    current=record['median_time']))
+        if record['peak_memory'] is not None and old.get('peak_memory') is not None \
+                and record['peak_memory'] > old['peak_memory'] * (1 + memory_tolerance):
+            regressions.append(dict(zip(('n_samples', 'dataset', 'algorithm'), _key(record)),
+                                    measure='peak_memory', baseline=old['peak_memory'],
+                                    current=record['peak_memory']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scalability benchmark of the clustering algorithms")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 1500, 5000, 15000])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--algorithms', nargs='+', choices=clustering_names)
+    parser.add_argument('--datasets', nargs='+', choices=dataset_names)
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc run")
+    parser.add_argument('--no-caps', action='store_true', help="also run the cells above max_samples")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help="json results of an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    records = []
+
+    def save(record):
+        #
+        #   the output file is rewritten after every cell, a crash or a kill keeps what was measured
+        records.append(record)
+        with open(args.output, 'wt', encoding='utf8') as f:
+            json.dump(records, f, indent=1)
+        print('%7d  %-14s %-24s %9.4fs  %s' % (record['n_samples'], record['dataset'], record['algorithm'],
+                                               record['median_time'], record['peak_memory']))
+        sys.stdout.flush()
+
+    run_benchmark(args.sizes, args.repeats, args.algorithms, args.datasets, not args.no_memory,
+                  caps={} if args.no_caps else None, on_record=save)
+    if args.baseline:
+        with open(args.baseline, 'rt', encoding='utf8') as f:
+            regressions = compare(records, json.load(f), args.tolerance, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION %(algorithm)s on %(dataset)s, n=%(n_samples)d : %(measure)s '
+                  '%(baseline)s -> %(current)s' % regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
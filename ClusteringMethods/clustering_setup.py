@@ -0,0 +1,313 @@
+"""
+Datasets and clustering estimators of the cluster comparison
+
+Shared by "plot_cluster_comparison WITH REPORT.py" and the benchmark suite,
+so both always run exactly the same configurations.
+"""
+import numpy as np
+
+#
+#   a list of clustering names which has been used in this code
+clustering_names = [
+    'MiniBatchKMeans', 'AffinityPropagation', 'MeanShift',
+    'SpectralClustering', 'Ward', 'AgglomerativeClustering',
+    'DBSCAN', 'Birch']
+#
+#   a list of dataset names in the order make_datasets returns them
+dataset_names = ['noisy_circles', 'noisy_moons', 'blobs', 'no_structure']
+
+
+def make_datasets(n_samples, random_state=0):
+    #
+    #   Create the 4 toy datasets, each one is a tuple (X, y)
+    #   All random draws come from one RandomState seeded with random_state, in the same order as
+    #   the original np.random.seed(0) script, so the default gives the same data as before
+    #   Arguments :
+    #   @n_samples = number of samples to be created in every dataset
+    #   @random_state = seed of the random number generator
+    from sklearn import datasets
+    rng = np.random.RandomState(random_state)
+    #
+    #   figure looks like a hierarchical circles with the same center
+    #   @factor = Scale factor between inner and outer circle
+    #   @noise = Standard deviation of Gaussian noise added to the data
+    noisy_circles = datasets.make_circles(n_samples=n_samples, factor=.5, noise=.05, random_state=rng)
+    #
+    #   figure looks like two moons which stock together in opposite positions
+    noisy_moons = datasets.make_moons(n_samples=n_samples, noise=.05, random_state=rng)
+    #
+    #   figure looks like some drop of blobs, always drawn with seed 8
+    blobs = datasets.make_blobs(n_samples=n_samples, random_state=8)
+    #
+    #   figure looks like a messed page with some sands which has no structure in it
+    no_structure = rng.rand(n_samples, 2), None
+    return [noisy_circles, noisy_moons, blobs, no_structure]
+
+
+def prepare(dataset):
+    #
+    #   normalize dataset for easier parameter selection
+    from sklearn.preprocessing import StandardScaler
+    X, y = dataset
+    return StandardScaler().fit_transform(X), y
+
+
+def _rp_tree_leaves(X, leaf_size, rng):
+    #
+    #   leaves of one random projection tree, every node splits its points at the median of their
+    #   projections onto the line through two random points of the node
+    leaves = []
+    stack = [np.arange(len(X))]
+    while stack:
+        indexes = stack.pop()
+        if len(indexes) <= leaf_size:
+            leaves.append(indexes)
+            continue
+        a, b = rng.choice(indexes, 2, replace=False)
+        projection = X[indexes] @ (X[a] - X[b])
+        half = len(indexes) // 2
+        order = np.argpartition(projection, half)
+        stack.append(indexes[order[:half]])
+        stack.append(indexes[order[half:]])
+    return leaves
+
+
+def _merge_candidates(best_indexes, best_distances, rows, candidates, distances):
+    #
+    #   keep the n_neighbors closest of the current neighbors and the candidates of rows
+    #   the point itself and repeated candidates are dropped
+    n_neighbors = best_indexes.shape[1]
+    merged = np.hstack([best_indexes[rows], candidates])
+    merged_distances = np.hstack([best_distances[rows], distances])
+    merged_distances[merged == rows[:, None]] = np.inf
+    order = np.argsort(merged, axis=1, kind='stable')
+    merged = np.take_along_axis(merged, order, axis=1)
+    merged_distances = np.take_along_axis(merged_distances, order, axis=1)
+    merged_distances[:, 1:][merged[:, 1:] == merged[:, :-1]] = np.inf
+    closest = np.argpartition(merged_distances, n_neighbors - 1, axis=1)[:, :n_neighbors]
+    merged = np.take_along_axis(merged, closest, axis=1)
+    merged_distances = np.take_along_axis(merged_distances, closest, axis=1)
+    order = np.argsort(merged_distances, axis=1, kind='stable')
+    best_indexes[rows] = np.take_along_axis(merged, order, axis=1)
+    best_distances[rows] = np.take_along_axis(merged_distances, order, axis=1)
+
+
+def approximate_neighbors(X, n_neighbors=10, n_trees=8, leaf_size=None, n_refinements=1, random_state=0,
+                          chunk_size=4096):
+    #
+    #   approximate k nearest neighbors (without the point itself) from a forest of random projection
+    #   trees : exact distances are only computed inside the leaves, then passes over the neighbors
+    #   of neighbors fix most of the misses near the leaf borders
+    #   @n_trees = number of trees, more trees give a better recall for a linear cost
+    #   @n_refinements = passes over the neighbors of neighbors, worth raising for high dimensional data
+    #   the recall drops quickly with the dimension, see neighbor_graph for measured values
+    #   @leaf_size = maximum points in a leaf, 3 * n_neighbors (at least 32) by default
+    #   returns (indexes, distances), both of shape (n_samples, n_neighbors), closest first
+    X = np.asarray(X, dtype=np.float64)
+    n_samples = len(X)
+    leaf_size = leaf_size or max(3 * n_neighbors, 32)
+    rng = np.random.RandomState(random_state)
+    best_indexes = np.zeros((n_samples, n_neighbors), dtype=np.int64)
+    best_distances = np.full((n_samples, n_neighbors), np.inf)
+    rows = np.arange(n_samples)
+    for _ in range(n_trees):
+        #
+        #   leaves padded to leaf_size with -1, every point gets all members of its leaf as candidates
+        leaves = _rp_tree_leaves(X, leaf_size, rng)
+        sizes = np.array([len(leaf) for leaf in leaves])
+        points = np.concatenate(leaves)
+        owners = np.repeat(np.arange(len(leaves)), sizes)
+        members = np.full((len(leaves), leaf_size), -1, dtype=np.int64)
+        members[owners, np.arange(n_samples) - np.repeat(np.cumsum(sizes) - sizes, sizes)] = points
+        leaf_of = np.empty(n_samples, dtype=np.int64)
+        leaf_of[points] = owners
+        for start in range(0, n_samples, chunk_size):
+            chunk = rows[start:start + chunk_size]
+            candidates = members[leaf_of[chunk]]
+            distances = np.sqrt(((X[candidates] - X[chunk, None, :]) ** 2).sum(axis=2))
+            distances[candidates < 0] = np.inf
+            _merge_candidates(best_indexes, best_distances, chunk, candidates, distances)
+    for _ in range(n_refinements):
+        neighbors = best_indexes.copy()
+        for start in range(0, n_samples, chunk_size):
+            chunk = rows[start:start + chunk_size]
+            candidates = neighbors[neighbors[chunk]].reshape(len(chunk), -1)
+            distances = np.sqrt(((X[candidates] - X[chunk, None, :]) ** 2).sum(axis=2))
+            _merge_candidates(best_indexes, best_distances, chunk, candidates, distances)
+    return best_indexes, best_distances
+
+
+#
+#   neighbors of every point in the shared neighbor graph (spectral clustering counts the point itself)
+graph_neighbors = 10
+#
+#   neighbor graphs already computed in this process, {(content hash, n_neighbors, approximate): graph}
+_graph_cache = {}
+_graph_cache_size = 16
+
+
+def neighbor_graph(X, n_neighbors=None, approximate=False):
+    #
+    #   sparse k nearest neighbors graph of X, computed once per dataset and shared by Ward, average
+    #   linkage and spectral clustering. Every row holds the point itself (an explicit zero distance)
+    #   followed by the distances to its n_neighbors closest other points, the same neighborhoods
+    #   spectral clustering (self included) and the connectivity of Ward (self excluded) used to build
+    #   @approximate = use random projection trees instead of the exact search, opt-in : on low dimensional
+    #   data like the 2-D toy datasets the exact tree search is faster (about 12s against 107s and a third
+    #   of the memory at 1M points) and the forest finds all neighbors anyway.
+    #   In higher dimension the forest trades recall (share of the exact neighbors found) for time, with
+    #   the defaults of approximate_neighbors (8 trees, 1 refinement) on gaussian data :
+    #       16-D,  20k points : recall 0.52, 32 trees and 3 refinements reach 0.91 (exact search 1.7s)
+    #       16-D, 200k points : recall 0.38 in 29s against 204s for the exact search (0.83 in 99s with 32/3)
+    #   so it only pays off on large high dimensional inputs where a partly wrong graph is acceptable
+    import hashlib
+    from scipy import sparse
+    n_neighbors = n_neighbors or graph_neighbors
+    X = np.ascontiguousarray(X)
+    key = hashlib.sha1(X.tobytes()).hexdigest(), X.shape, n_neighbors, bool(approximate)
+    if key in _graph_cache:
+        return _graph_cache[key]
+    if approximate:
+        indexes, distances = approximate_neighbors(X, n_neighbors)
+    else:
+        from sklearn.neighbors import NearestNeighbors
+        distances, indexes = NearestNeighbors(n_neighbors=n_neighbors).fit(X).kneighbors()
+    n_samples = len(X)
+    indexes = np.hstack([np.arange(n_samples)[:, None], indexes])
+    distances = np.hstack([np.zeros((n_samples, 1)), distances])
+    graph = sparse.csr_matrix((distances.ravel(), indexes.ravel(),
+                               np.arange(0, indexes.size + 1, n_neighbors + 1)), shape=(n_samples, n_samples))
+    if len(_graph_cache) >= _graph_cache_size:
+        del _graph_cache[next(iter(_graph_cache))]
+    _graph_cache[key] = graph
+    return graph
+
+
+def clear_graph_cache():
+    _graph_cache.clear()
+
+
+def connectivity_graph(X=None, n_neighbors=None, graph=None):
+    #
+    #   connectivity matrix for structured Ward
+    #   accumulated with it's transposed which makes connectivity symmetric
+    #   @graph = neighbor graph of X to derive it from, see neighbor_graph
+    from scipy import sparse
+    if graph is None:
+        graph = neighbor_graph(X, n_neighbors)
+    rows = np.repeat(np.arange(graph.shape[0]), np.diff(graph.indptr))
+    others = graph.indices != rows
+    connectivity = sparse.csr_matrix((np.ones(others.sum()), (rows[others], graph.indices[others])),
+                                     shape=graph.shape)
+    return 0.5 * (connectivity + connectivity.T)
+
+
+def _average_linkage(settings):
+    #
+    #   the distance argument was renamed from affinity to metric in newer scikit-learn
+    from sklearn import cluster
+    try:
+        return cluster.AgglomerativeClustering(**settings)
+    except TypeError:
+        settings = dict(settings)
+        settings['affinity'] = settings.pop('metric')
+        return cluster.AgglomerativeClustering(**settings)
+
+
+#
+#   seed of the randomized estimators, so that every fit is reproducible (and can be reused from a cache)
+estimator_seed = 0
+#
+#   MeanShift bandwidth is estimated from the data at this quantile of the pairwise distances
+bandwidth_quantile = 0.3
+#
+#   constructor settings of every estimator that do not depend on the data
+#   the data dependent ones (MeanShift bandwidth, connectivity) are added by make_estimator
+estimator_settings = {
+    #
+    #   two_means Algorithm
+    'MiniBatchKMeans': {'n_clusters': 2, 'random_state': estimator_seed},
+    #
+    #   Affinity Propagation Algorithm
+    'AffinityPropagation': {'damping': .9, 'preference': -200, 'random_state': estimator_seed},
+    #
+    #   MeanShift Algorithm with an estimated bandwidth
+    'MeanShift': {'bin_seeding': True},
+    #
+    #   Spectral Algorithm on the shared neighbor graph instead of building its own
+    'SpectralClustering': {'n_clusters': 2, 'eigen_solver': 'arpack', 'affinity': 'precomputed_nearest_neighbors',
+                           'n_neighbors': graph_neighbors, 'random_state': estimator_seed},
+    #
+    #   Agglomerative Algorithm
+    'Ward': {'n_clusters': 2, 'linkage': 'ward'},
+    #
+    #   average linkage, see _average_linkage
+    'AgglomerativeClustering': {'n_clusters': 2, 'linkage': 'average', 'metric': 'cityblock'},
+    #
+    #   DBscan Algorithm
+    'DBSCAN': {'eps': .2},
+    #
+    #   Birch Algorithm
+    'Birch': {'n_clusters': 2},
+}
+
+
+def make_estimator(name, X, graph=None):
+    #
+    #   create one clustering estimator by its name in clustering_names, for the normalized dataset X
+    #   only what the estimator needs is computed (bandwidth, connectivity)
+    #   @graph = precomputed neighbor graph of X (see neighbor_graph), looked up when None and needed
+    #   fit it on fit_input(name, X, graph)
+    from sklearn import cluster
+    if name not in estimator_settings:
+        raise ValueError("unknown clustering algorithm %r" % name)
+    settings = dict(estimator_settings[name])
+    if name == 'MeanShift':
+        settings['bandwidth'] = cluster.estimate_bandwidth(X, quantile=bandwidth_quantile)
+    if name in ('Ward', 'AgglomerativeClustering'):
+        settings['connectivity'] = connectivity_graph(X, graph=graph)
+    if name == 'AgglomerativeClustering':
+        return _average_linkage(settings)
+    return getattr(cluster, 'AgglomerativeClustering' if name == 'Ward' else name)(**settings)
+
+
+def estimator_key(name, approximate=False):
+    #
+    #   everything besides the data that decides the result of make_estimator(name, ...), e.g. for cache
+    #   keys, without building the estimator (estimating the MeanShift bandwidth alone is quadratic)
+    #   @approximate = whether the neighbor graph is approximate, see neighbor_graph
+    params = dict(estimator_settings[name])
+    if name == 'MeanShift':
+        params['bandwidth_quantile'] = bandwidth_quantile
+    if uses_neighbor_graph(name):
+        params.update(n_neighbors=graph_neighbors, approximate=bool(approximate))
+    return params
+
+
+def fit_input(name, X, graph=None):
+    #
+    #   what the estimator of make_estimator is fitted on : the neighbor graph for spectral, X otherwise
+    if name == 'SpectralClustering':
+        return neighbor_graph(X) if graph is None else graph
+    return X
+
+
+def uses_neighbor_graph(name):
+    return name in ('SpectralClustering', 'Ward', 'AgglomerativeClustering')
+
+
+def make_estimators(X, graph=None):
+    #
+    #   create all clustering estimators for the normalized dataset X
+    #   returns a list in the order of clustering_names
+    if graph is None:
+        graph = neighbor_graph(X)
+    return [make_estimator(name, X, graph) for name in clustering_names]
+
+
+def predicted_labels(algorithm, X):
+    #
+    #   cluster memberships of a fitted algorithm
+    if hasattr(algorithm, 'labels_'):
+        return algorithm.labels_.astype(int)
+    return algorithm.predict(X)
@@ -0,0 +1,100 @@
+"""
+Guarded concurrent execution of the clustering grid
+
+Every (dataset, algorithm) pair is fitted in its own worker process with a
+wall-clock timeout and an address-space limit (Unix only). A run that times
+out, runs out of memory, raises or gets killed is recorded with its status
+instead of aborting the whole grid. Up to n_jobs pairs run at once.
+"""
+import os
+import time
+import multiprocessing
+from multiprocessing.connection import wait
+
+from clustering_setup import make_estimator, fit_input, predicted_labels
+
+#
+#   status of a finished run
+OK = 'ok'
+TIMEOUT = 'timeout'
+OUT_OF_MEMORY = 'out_of_memory'
+ERROR = 'error'
+KILLED = 'killed'
+
+
+def _limit_memory(memory_limit):
+    #
+    #   cap the address space of the current process, silently unavailable on Windows
+    try:
+        import resource
+    except ImportError:
+        return
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+
+def _guarded_fit(connection, name, X, graph, memory_limit):
+    #
+    #   body of a worker process, always answers with one result dictionary
+    import warnings
+    warnings.simplefilter('ignore')
+    if memory_limit:
+        _limit_memory(memory_limit)
+    try:
+        algorithm = make_estimator(name, X, graph)
+        data = fit_input(name, X, graph)
+        t0 = time.perf_counter()
+        algorithm.fit(data)
+        t1 = time.perf_counter()
+        result = {'status': OK, 'seconds': t1 - t0, 'labels': predicted_labels(algorithm, X),
+                  'centers': getattr(algorithm, 'cluster_centers_', None)}
+    except MemoryError:
+        result = {'status': OUT_OF_MEMORY}
+    except Exception as error:
+        result = {'status': ERROR, 'message': repr(error)}
+    connection.send(result)
+    connection.close()
+
+
+def run_guarded(tasks, timeout=60.0, memory_limit=None, n_jobs=None):
+    #
+    #   run tasks concurrently, each one in its own process
+    #   @tasks = list of (key, algorithm name, X, neighbor graph of X or None), see clustering_setup.neighbor_graph
+    #   @timeout = wall-clock seconds allowed per run (fit and setup)
+    #   @memory_limit = bytes of address space per worker, None for no limit
+    #   returns {key: result} where result holds status, seconds and, for finished runs, labels and centers
+    context = multiprocessing.get_context('spawn')
+    n_jobs = n_jobs or os.cpu_count()
+    pending = list(tasks)
+    running = {}
+    results = {}
+    while pending or running:
+        while pending and len(running) < n_jobs:
+            key, name, X, graph = pending.pop(0)
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=_guarded_fit, args=(sender, name, X, graph, memory_limit))
+            process.start()
+            sender.close()
+            running[receiver] = (key, process, time.perf_counter())
+        wait(list(running) + [process.sentinel for _, process, _ in running.values()], timeout=0.05)
+        for receiver in list(running):
+            key, process, started = running[receiver]
+            elapsed = time.perf_counter() - started
+            alive = process.is_alive()
+            if receiver.poll():
+                try:
+                    results[key] = receiver.recv()
+                except EOFError:
+                    results[key] = {'status': KILLED, 'seconds': elapsed, 'exitcode': process.exitcode}
+            elif not alive:
+                #
+                #   died without answering, e.g. stopped by the operating system's out of memory killer
+                results[key] = {'status': KILLED, 'seconds': elapsed, 'exitcode': process.exitcode}
+            elif elapsed > timeout:
+                process.terminate()
+                results[key] = {'status': TIMEOUT, 'seconds': elapsed}
+            else:
+                continue
+            process.join()
+            receiver.close()
+            del running[receiver]
+    return results
@@ -20,24 +20,18 @@ create many clusters. Thus in this example its two parameters
 (damping and per-point preference) were set to mitigate this
 behavior.
 """
-#
-#   print out above document
-print(__doc__)
-
-import time
-
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-import matplotlib.pyplot as plt
-
-from sklearn import cluster, datasets
-from sklearn.neighbors import kneighbors_graph
-from sklearn.preprocessing import StandardScaler
 
 #
-#   Cause random numbers predictable , this means that every time random number going to create
-#   it choose the same data which has been created on previous call to np.random.rand method
-#   though the same data will appear each time
-np.random.seed(0)
+#   make the shared helpers of the repository root importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import cli, raster, results as result_cache
+from clustering_setup import clustering_names, make_datasets, prepare, neighbor_graph, uses_neighbor_graph, \
+    estimator_key, estimator_seed
+from guarded_runner import run_guarded, OK
 
 # Generate datasets. We choose the size big enough to see the scalability
 # of the algorithms, but not too big to avoid too long running times
@@ -45,40 +39,30 @@ np.random.seed(0)
 #   Number of instances in each figure
 n_samples = 1500
 #
-#   Create data for 1st row figure
-#   figure looks like a hierarchical circles with the same center
-#   data comes from Sklearn datasets library
-#   Arguments :
-#   @n_samples = number of samples to be created
-#   @factor = Scale factor between inner and outer circle
-#   @noise = Standard deviation of Gaussian noise added to the data
-noisy_circles = datasets.make_circles(n_samples=n_samples, factor=.5,
-                                      noise=.05)
+#   Every algorithm runs in its own worker process, guarded by these limits
+#   @timeout = wall-clock seconds allowed for one algorithm on one dataset
+#   @memory_limit = bytes of memory allowed for one run (None for no limit)
+timeout = 120
+memory_limit = None
 #
-#   Create data for 2nd row figure
-#   figure looks like two moons which stock together in opposite positions
-#   data comes from Sklearn datasets library
-#   Arguments :
-#   @n_samples = number of samples to be created
-#   @noise = Standard deviation of Gaussian noise added to the data
-noisy_moons = datasets.make_moons(n_samples=n_samples, noise=.05)
+#   Build the shared neighbor graph with random projection trees instead of the exact search, only faster on
+#   high dimensional data (see clustering_setup.neighbor_graph)
+approximate_graph = False
 #
-#   Create data for 3rd row figure
-#   figure looks like some drop of blobs
-#   data comes from Sklearn datasets library
-#   Arguments :
-#   @n_samples = number of samples to be created
-#   @random_state = this is the seed number used by the random number generator
-blobs = datasets.make_blobs(n_samples=n_samples, random_state=8)
+#   Datasets larger than raster_threshold are drawn as density images of raster_bins x raster_bins cells
+#   instead of one marker per point, see common.raster
+raster_threshold = 20000
+raster_bins = 300
 #
-#   Create data for 4th row figure
-#   Create an array of the given shape and propagate it with random samples from a uniform distribution over [0, 1)
-#   figure looks like a messed page with some sands which has no structure in it
-#   Arguments :
-#   @n_samples = number of samples to be created
-#   @second argument = define's shape of the data
-#   as the output is tuple , "None" at the end of the line is specified for making the second index of our tuple blank
-no_structure = np.random.rand(n_samples, 2), None
+#   Directory to render every panel into its own png file (in parallel), None for one interactive figure
+panel_directory = None
+#
+#   Reuse the finished runs of earlier executions (see common.results), keyed by the dataset content, the
+#   algorithm, its settings and the estimator seed. Set to False to fit everything again
+use_cache = True
+#
+#   Visible range of every panel (x min, x max, y min, y max)
+panel_extent = (-2, 2, -2, 2)
 #
 #   Array of color names
 colors = np.array([x for x in 'bgrcmykbgrcmykbgrcmykbgrcmyk'])
@@ -86,177 +70,201 @@ colors = np.array([x for x in 'bgrcmykbgrcmykbgrcmykbgrcmyk'])
 #   Makes color array larger by 20 point
 colors = np.hstack([colors] * 20)
 
-#
-#   a list of clustering names which has been used in this code
-clustering_names = [
-    'MiniBatchKMeans', 'AffinityPropagation', 'MeanShift',
-    'SpectralClustering', 'Ward', 'AgglomerativeClustering',
-    'DBSCAN', 'Birch']
-#
-#   Create a plot with a graphical user interface in order to visualize each algorithm
-#   Arguments :
-#   @figsize = specify figure size in inches
-plt.figure(figsize=(len(clustering_names) * 2 + 3, 9.5))
-#
-#   Tune the subplot layout (within the previous line of code we just created a figure which would have
-#   some subplot's inside it)
-#   Arguments :
-#   @left = the left side of the subplots of the figure
-#   @right = the right side of the subplots of the figure
-#   @bottom = the bottom of the subplots of the figure
-#   @top = the top of the subplots of the figure
-#   @wspace = the amount of width reserved for blank space between subplots
-#   @hspace = the amount of height reserved for white space between subplots
-plt.subplots_adjust(left=.02, right=.98, bottom=.001, top=.96, wspace=.05,
-                    hspace=.01)
-#
-#   Position of plot for each algorithm
-#   This variable will be used for detect location of the plot to be illustrated
-plot_num = 1
-#
-#   A list of all datasets which just created in previous lines of code
-datasets = [noisy_circles, noisy_moons, blobs, no_structure]
-#
-#   Iterate in datasets
-#   In each iteration one row of the figure will be illustrated
-#   Iteration variables :
-#   %i_dataset = this variable used to detect first row of figures in order to stick a title above them
-#   %dataset = contains a data set to be currently used by each algorithm
-for i_dataset, dataset in enumerate(datasets):
-    #
-    #   Intermediate variable to store our dataset
-    X, y = dataset
-    #
-    #   normalize dataset for easier parameter selection
-    X = StandardScaler().fit_transform(X)
 
+def run_grid(datasets):
     #
-    #   estimate bandwidth for mean shift
-    bandwidth = cluster.estimate_bandwidth(X, quantile=0.3)
+    #   Fit the whole (dataset, algorithm) grid concurrently across the cores
+    #   The neighbor graph of each dataset is computed once here and shared by Ward, average linkage
+    #   and spectral clustering (approximate when approximate_graph is set, see clustering_setup.neighbor_graph)
+    #   Runs found in the result cache are not fitted again, finished runs are stored into it
+    #   returns {(i_dataset, name): result}, see guarded_runner.run_guarded
+    cache = result_cache.ResultCache() if use_cache else None
+    results = {}
+    tasks = []
+    keys = {}
+    for i_dataset, (X, y) in enumerate(datasets):
+        graph = neighbor_graph(X, approximate=approximate_graph)
+        dataset = result_cache.data_hash(X)
+        for name in clustering_names:
+            task_graph = graph if uses_neighbor_graph(name) else None
+            if cache is not None:
+                #
+                #   the key only needs the static settings, no estimator is built here (see estimator_key)
+                params = estimator_key(name, approximate_graph)
+                keys[(i_dataset, name)] = dataset, result_cache.result_key(dataset, name, params, estimator_seed)
+                results[(i_dataset, name)] = cache.get(keys[(i_dataset, name)][1])
+                if results[(i_dataset, name)] is not None:
+                    continue
+            tasks.append(((i_dataset, name), name, X, task_graph))
+    fitted = run_guarded(tasks, timeout=timeout, memory_limit=memory_limit)
+    for key, result in fitted.items():
+        #
+        #   stopped runs depend on the limits of this execution, only finished ones are kept
+        if cache is not None and result['status'] == OK:
+            dataset, entry = keys[key]
+            cache.put(entry, result, dataset, key[1])
+    results.update(fitted)
+    return results
+
 
+def panel_content(X, result):
     #
-    #   connectivity matrix for structured Ward
-    connectivity = kneighbors_graph(X, n_neighbors=10, include_self=False)
+    #   What one panel draws, small enough to be sent to another process : the status of a stopped
+    #   run, or the points (a density image for large datasets), the centers and the elapsed time
+    if result['status'] != OK:
+        #
+        #   The run was stopped (timeout, out of memory, killed or error), write its status instead
+        return {'label': result['status']}
     #
-    #   This line accumulates connectivity with it's transposed
-    #   which makes connectivity symmetric
-    connectivity = 0.5 * (connectivity + connectivity.T)
+    #   Predict color schema
+    y_pred = result['labels']
+    content = {'label': ('%.2fs' % result['seconds']).lstrip('0'), 'centers': result['centers']}
+    if len(X) > raster_threshold:
+        from matplotlib.colors import to_rgba_array
+        content['image'] = raster.rasterize(X, y_pred, to_rgba_array(colors), raster_bins, panel_extent)[0]
+    else:
+        content['points'] = X
+        content['colors'] = colors[y_pred].tolist()
+    return content
+
 
-    # create clustering estimators
+def draw_panel(ax, content):
+    if 'image' in content:
+        #
+        #   One image for the whole dataset, each cell colored by the clusters of its points
+        raster.draw(ax, content['image'], panel_extent)
+    elif 'points' in content:
+        #
+        #   Figure a scatter graph with our data
+        #   colorize the points by a prediction variable
+        #   first argument = x axis of scatter
+        #   second argument = y axis of scatter
+        #   s = size of the scatter in points^2
+        X = content['points']
+        ax.scatter(X[:, 0], X[:, 1], color=content['colors'], s=10)
     #
-    #   MeanShift Algorithm
-    ms = cluster.MeanShift(bandwidth=bandwidth, bin_seeding=True)
+    #   Determine if current algorithm has cluster centers or not
+    centers = content.get('centers')
+    if centers is not None:
+        #
+        #   Calculate centers color
+        center_colors = colors[:len(centers)]
+        #
+        #   Plot a scatter for centers
+        ax.scatter(centers[:, 0], centers[:, 1], s=100, c=center_colors)
     #
-    #   two_means Algorithm
-    two_means = cluster.MiniBatchKMeans(n_clusters=2)
+    #   Set range of x axis
+    ax.set_xlim(panel_extent[0], panel_extent[1])
     #
-    #   Agglomerative Algorithm
-    ward = cluster.AgglomerativeClustering(n_clusters=2, linkage='ward',
-                                           connectivity=connectivity)
+    #   Set range of y axis
+    ax.set_ylim(panel_extent[2], panel_extent[3])
     #
-    #   Spectral Algorithm
-    spectral = cluster.SpectralClustering(n_clusters=2,
-                                          eigen_solver='arpack',
-                                          affinity="nearest_neighbors")
+    #   Clear labels of x axis
+    ax.set_xticks(())
     #
-    #   DBscan Algorithm
-    dbscan = cluster.DBSCAN(eps=.2)
+    #   Clear labels of y axis
+    ax.set_yticks(())
     #
-    #   Affinity Propagation Algorithm
-    affinity_propagation = cluster.AffinityPropagation(damping=.9,
-                                                       preference=-200)
+    #   Write Elapsed time (or status) of algorithm onto the plot
+    ax.text(.99, .01, content['label'],
+            transform=ax.transAxes, size=15,
+            horizontalalignment='right')
+
+
+def plot_grid(datasets, results):
+    plt = cli.pyplot()
     #
-    #   Calculate the average linkage
-    average_linkage = cluster.AgglomerativeClustering(
-        linkage="average", affinity="cityblock", n_clusters=2,
-        connectivity=connectivity)
+    #   Create a plot with a graphical user interface in order to visualize each algorithm
+    #   Arguments :
+    #   @figsize = specify figure size in inches
+    plt.figure(figsize=(len(clustering_names) * 2 + 3, 9.5))
     #
-    #   Birch Algorithm
-    birch = cluster.Birch(n_clusters=2)
+    #   Tune the subplot layout (within the previous line of code we just created a figure which would have
+    #   some subplot's inside it)
+    #   Arguments :
+    #   @left = the left side of the subplots of the figure
+    #   @right = the right side of the subplots of the figure
+    #   @bottom = the bottom of the subplots of the figure
+    #   @top = the top of the subplots of the figure
+    #   @wspace = the amount of width reserved for blank space between subplots
+    #   @hspace = the amount of height reserved for white space between subplots
+    plt.subplots_adjust(left=.02, right=.98, bottom=.001, top=.96, wspace=.05,
+                        hspace=.01)
     #
-    #   A list of each algorithm result which will be used in inner for loop
-    clustering_algorithms = [
-        two_means, affinity_propagation, ms, spectral, ward, average_linkage,
-        dbscan, birch]
+    #   Position of plot for each algorithm
+    #   This variable will be used for detect location of the plot to be illustrated
+    plot_num = 1
     #
-    #   Calculate each algorithm and illustrate in plot graph
-    for name, algorithm in zip(clustering_names, clustering_algorithms):
-        # predict cluster memberships
-        #
-        #   Time stamp to determine how much time it takes to do the algorithm
-        #   "Start time"
-        t0 = time.time()
-        #
-        #   Doing the algorithm
-        algorithm.fit(X)
-        #
-        #   End of time stamp
-        #   in this line we will know about duration of the algorithm
-        #   "End time"
-        t1 = time.time()
+    #   Iterate in datasets
+    #   In each iteration one row of the figure will be illustrated
+    #   Iteration variables :
+    #   %i_dataset = this variable used to detect first row of figures in order to stick a title above them
+    #   %X = contains the normalized data set used by each algorithm
+    for i_dataset, (X, y) in enumerate(datasets):
         #
-        #   determine if specified algorithm has mentioned attribute or not
-        if hasattr(algorithm, 'labels_'):
+        #   Illustrate the result of each algorithm in plot graph
+        for name in clustering_names:
             #
-            #   Predict color schema
-            y_pred = algorithm.labels_.astype(np.int)
-        else:
+            #   Create subplot with 4 rows and columns by length of clustering_names variable at position plot_num
+            ax = plt.subplot(4, len(clustering_names), plot_num)
             #
-            #   Predict color schema
-            y_pred = algorithm.predict(X)
-
-        # plot
-        #
-        #   Create subplot with 4 rows and columns by length of clustering_algorithms variable at position plot_num
-        plt.subplot(4, len(clustering_algorithms), plot_num)
-        #
-        #   if iteration is for first time
-        #   we are in first row
-        #   then we can stick a title label above the plot
-        if i_dataset == 0:
-            #
-            #   stick a title label above the plot
-            #   with title = name and size of 18
-            plt.title(name, size=18)
-        #
-        #   Figure a scatter graph with our data
-        #   colorize the points by a prediction variable
-        #   first argument = x axis of scatter
-        #   second argument = y axis of scatter
-        #   s = size of the scatter in points^2
-        plt.scatter(X[:, 0], X[:, 1], color=colors[y_pred].tolist(), s=10)
-        #
-        #   Determine if current algorithm has mentioned attribute or not
-        if hasattr(algorithm, 'cluster_centers_'):
-            #
-            #   Calculate centers
-            centers = algorithm.cluster_centers_
+            #   if iteration is for first time
+            #   we are in first row
+            #   then we can stick a title label above the plot
+            if i_dataset == 0:
+                #
+                #   stick a title label above the plot
+                #   with title = name and size of 18
+                ax.set_title(name, size=18)
+            draw_panel(ax, panel_content(X, results[(i_dataset, name)]))
             #
-            #   Calculate centers color
-            center_colors = colors[:len(centers)]
-            #
-            #   Plot a scatter for centers
-            plt.scatter(centers[:, 0], centers[:, 1], s=100, c=center_colors)
-        #
-        #   Set range of x axis
-        plt.xlim(-2, 2)
-        #
-        #   Set range of y axis
-        plt.ylim(-2, 2)
-        #
-        #   Clear labels of x axis
-        plt.xticks(())
-        #
-        #   Clear labels of y axis
-        plt.yticks(())
-        #
-        #   Write Elapsed time of algorithm onto the plot
-        plt.text(.99, .01, ('%.2fs' % (t1 - t0)).lstrip('0'),
-                 transform=plt.gca().transAxes, size=15,
-                 horizontalalignment='right')
-        #
-        #   Increase plot_num (This variable was position of plot that is currently in progress)
-        plot_num += 1
-#
-#   Show the plot into graphical user interface
-plt.show()
+            #   Increase plot_num (This variable was position of plot that is currently in progress)
+            plot_num += 1
+    #
+    #   Show the plot into graphical user interface
+    plt.show()
+
+
+def _render_panel(path, title, content):
+    #
+    #   body of a worker process, draws one panel into its own file with the Agg backend
+    plt = cli.pyplot(path)
+    fig, ax = plt.subplots(figsize=(4, 4))
+    ax.set_title(title)
+    draw_panel(ax, content)
+    fig.savefig(path)
+    plt.close(fig)
+    return path
+
+
+def render_panels(datasets, results, directory, n_jobs=None):
+    #
+    #   Render every panel into directory/<dataset number>_<algorithm>.png, panels are drawn concurrently
+    #   the panel contents (density images for large datasets) are computed here, so the workers only
+    #   receive small arrays
+    #   returns the list of written files
+    os.makedirs(directory, exist_ok=True)
+    paths, titles, contents = [], [], []
+    for i_dataset, (X, y) in enumerate(datasets):
+        for name in clustering_names:
+            paths.append(os.path.join(directory, '%d_%s.png' % (i_dataset, name)))
+            titles.append(name)
+            contents.append(panel_content(X, results[(i_dataset, name)]))
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        return list(executor.map(_render_panel, paths, titles, contents))
+
+
+if __name__ == '__main__':
+    #
+    #   print out above document
+    print(__doc__)
+    #
+    #   Create the 4 datasets (circles, moons, blobs and no structure), see clustering_setup.make_datasets
+    #   the random numbers are predictable : seed 0 creates the same data on every run
+    #   each one is normalized for easier parameter selection
+    prepared = [prepare(dataset) for dataset in make_datasets(n_samples, random_state=0)]
+    results = run_grid(prepared)
+    if panel_directory is None:
+        plot_grid(prepared, results)
+    else:
+        render_panels(prepared, results, panel_directory)
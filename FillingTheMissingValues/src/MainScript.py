@@ -7,13 +7,14 @@ Fill missing values by 3 ways below :
 - KNN
 """
 import os
+import sys
 import random
-import copy
-import math
+import hashlib
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-from sklearn.neighbors import KNeighborsRegressor
+#
+# make the shared helpers of the repository root importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from common import cli, datasets, metrics, pools
 
 
 def path_input_file():
@@ -24,49 +25,90 @@ def path_input_file():
 def input_data():
     fields = ["Area", "status"]
     #
-    # reading data from csv file
-    data = pd.read_csv(path_input_file(), header=0, usecols=fields)
-    return data.as_matrix()
+    # reading data from the binary cache of the csv file
+    data, _ = datasets.load_matrix(path_input_file(), usecols=fields, dtype=np.float64)
+    return data
 
 
 def input_data_knn():
-    data = pd.read_csv(path_input_file(), header=0)
-    return data.as_matrix()
+    data, _ = datasets.load_matrix(path_input_file(), dtype=np.float64)
+    return data
 
 
-def delete_alfa_percent(alfa, data):
+def delete_alfa_percent(alfa, data, columns=(0,), rng=None):
+    #
+    # copy of data where alfa percent of the rows lose their value in columns (set to NaN)
+    # rng : optional numpy Generator, the random module is used otherwise
+    data = np.array(data, dtype=np.float64)
     data_len = len(data)
     sample_count = int(data_len * (alfa/100))
-    missing_indexes = random.sample(range(0, data_len-1), sample_count)
-    for element in missing_indexes:
-        data[element][0] = float(-1)
+    if rng is None:
+        missing_indexes = random.sample(range(0, data_len-1), sample_count)
+    else:
+        missing_indexes = rng.choice(data_len - 1, sample_count, replace=False)
+    data[np.ix_(missing_indexes, list(columns))] = np.nan
     return data, missing_indexes
 
 
-def mean(data):
-    sum_values = 0
-    for element in data:
-        if element[0] != float(-1):
-            sum_values += element[0]
-    return round(sum_values/(len(data)), 2)
+def missing_mask(data, sentinel=None):
+    #
+    # boolean mask of missing cells : NaN, or equal to sentinel when one is given (e.g. -1.0)
+    mask = np.isnan(data)
+    if sentinel is not None:
+        mask |= data == sentinel
+    return mask
+
+
+def column_means(data, mask):
+    #
+    # mean of the observed cells of every attribute
+    observed = (~mask).sum(axis=0)
+    sums = np.where(mask, 0.0, data).sum(axis=0)
+    return np.divide(sums, observed, out=np.full(sums.shape, np.nan), where=observed > 0)
+
+
+def class_means(data, labels, mask):
+    #
+    # group-by over labels : one bincount over all (class, attribute) cells at once
+    # returns (classes, means of shape (n_classes, n_attributes), codes of every row)
+    classes, codes = np.unique(labels, return_inverse=True)
+    codes = codes.ravel()
+    n_classes, n_attributes = len(classes), data.shape[1]
+    cells = (codes[:, None] * n_attributes + np.arange(n_attributes)).ravel()
+    size = n_classes * n_attributes
+    sums = np.bincount(cells, weights=np.where(mask, 0.0, data).ravel(), minlength=size)
+    observed = np.bincount(cells, weights=(~mask).ravel(), minlength=size)
+    means = np.divide(sums, observed, out=np.full(size, np.nan), where=observed > 0)
+    return classes, means.reshape(n_classes, n_attributes), codes
 
 
-def find_same_class_data(data, label):
-    output_data = []
-    for element in data:
-        if element[0] != float(-1) and element[1] == float(label):
-            output_data.append(np.array([element[0], element[1]]))
-    return np.array(output_data)
+def fill_by_mean(data, mask=None):
+    #
+    # fill every missing cell in place with its attribute mean
+    if mask is None:
+        mask = missing_mask(data)
+    rows, cols = np.nonzero(mask)
+    data[rows, cols] = column_means(data, mask)[cols]
+    return data
 
 
-def euclidean_distance(data, new_data, missing_indexes):
-    sum_values = 0
-    for element in missing_indexes:
-        sum_values += (abs((data[element][0] - new_data[element][0])))**2
-    return math.sqrt(sum_values)
+def fill_by_class_mean(data, labels, mask=None):
+    #
+    # fill every missing cell in place with the attribute mean of its class,
+    # the overall attribute mean is used when the class has no observed value
+    if mask is None:
+        mask = missing_mask(data)
+    _, means, codes = class_means(data, labels, mask)
+    rows, cols = np.nonzero(mask)
+    values = means[codes[rows], cols]
+    fallback = np.isnan(values)
+    values[fallback] = column_means(data, mask)[cols[fallback]]
+    data[rows, cols] = values
+    return data
 
 
-def plot_illustrate(mean_values, mean_class_values, knn_values, alfa_percent):
+def plot_illustrate(mean_values, mean_class_values, knn_values, alfa_percent, output_file=None):
+    plt = cli.pyplot(output_file)
     # Create a subplot with 1 row and 3 columns
     fig, (ax1, ax2, ax3) = plt.subplots(1, 3)
     fig.set_size_inches(5, 5)
@@ -102,55 +144,275 @@ def plot_illustrate(mean_values, mean_class_values, knn_values, alfa_percent):
     ax3.grid()
 
     plt.suptitle("Filling the missing values by 3 ways below", fontsize=14, fontweight='bold', color='blue')
-    plt.show()
+    cli.finish(plt, output_file)
 
 
-def via_knn_regression(data, knn_attributes, missing_att_index):
-    neigh = KNeighborsRegressor(n_neighbors=7)  # knn nearest neighbours
-    neigh.fit([list(row[knn_attributes]) for row in data if row[missing_att_index] != float(-1)],
-              [row[missing_att_index] for row in data if row[missing_att_index] != float(-1)])
-    for i in range(0, len(data)):
-        if data[i][missing_att_index] == float(-1):
-            data[i][missing_att_index] = neigh.predict([data[i][knn_attributes]])[0]
+def spatial_index(points, index_cache=None):
+    #
+    # KD-tree over points, trees are kept in index_cache keyed by the content of points
+    # so an unchanged set of complete rows is indexed only once
+    from sklearn.neighbors import KDTree
+    points = np.ascontiguousarray(points)
+    if index_cache is None:
+        return KDTree(points)
+    key = (points.shape, hashlib.sha1(points).hexdigest())
+    if key not in index_cache:
+        index_cache[key] = KDTree(points)
+    return index_cache[key]
+
+
+def knn_impute(data, targets, n_neighbors=7, index_cache=None):
+    #
+    # fill missing cells in place with the mean target of the n_neighbors nearest rows
+    # targets = {column: predictor columns}, every column is imputed from its own predictors
+    # one index is built over the rows whose predictors are complete and all missing rows of a
+    # column are answered by one batched query; neighbours without a target value are skipped
+    # rows with a missing predictor are left missing
+    mask = missing_mask(data)
+    for column, predictors in targets.items():
+        predictors = list(predictors)
+        queryable = ~mask[:, predictors].any(axis=1)
+        query_rows = np.flatnonzero(queryable & mask[:, column])
+        indexed_rows = np.flatnonzero(queryable)
+        has_target = ~mask[indexed_rows, column]
+        n_candidates = int(has_target.sum())
+        if len(query_rows) == 0 or n_candidates == 0:
+            continue
+        tree = spatial_index(data[np.ix_(indexed_rows, predictors)], index_cache)
+        target_values = np.where(has_target, data[indexed_rows, column], 0.0)
+        needed = min(n_neighbors, n_candidates)
+        #
+        # ask for enough neighbours to expect `needed` with a target, widen for the rows that fall short
+        k = min(len(indexed_rows), needed * len(indexed_rows) // n_candidates + needed)
+        pending = np.arange(len(query_rows))
+        values = np.empty(len(query_rows))
+        while len(pending):
+            _, neighbours = tree.query(data[np.ix_(query_rows[pending], predictors)], k=k)
+            valid = has_target[neighbours]
+            take = valid & (np.cumsum(valid, axis=1) <= needed)
+            done = take.sum(axis=1) == needed
+            values[pending[done]] = (take * target_values[neighbours]).sum(axis=1)[done] / needed
+            pending = pending[~done]
+            k = min(len(indexed_rows), 2 * k)
+        data[query_rows, column] = values
     return data
 
 
-def fill_missing():
-    data = input_data()
-    knn_data = input_data_knn()
-    mean_eucl = []
-    mean_class_eucl = []
-    knn_eucl = []
-    for alfa in range(5, 85, 5):
-        contain_missing_data, missing_indexes = delete_alfa_percent(alfa, copy.copy(data))
+def via_knn_regression(data, knn_attributes, missing_att_index, index_cache=None):
+    return knn_impute(data, {missing_att_index: knn_attributes}, index_cache=index_cache)
+
+
+def running_stats(values):
+    #
+    # (count, mean, M2) of every column of a batch, NaN cells are ignored
+    values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    observed = ~np.isnan(values)
+    count = observed.sum(axis=0).astype(np.float64)
+    sums = np.where(observed, values, 0.0).sum(axis=0)
+    mean = np.divide(sums, count, out=np.zeros(count.shape), where=count > 0)
+    m2 = np.where(observed, (values - mean) ** 2, 0.0).sum(axis=0)
+    return count, mean, m2
+
+
+def combine_stats(first, second):
+    #
+    # merge two (count, mean, M2) aggregates (Chan et al. parallel form of Welford's update)
+    count_a, mean_a, m2_a = first
+    count_b, mean_b, m2_b = second
+    count = count_a + count_b
+    delta = mean_b - mean_a
+    weight = np.divide(count_b, count, out=np.zeros(count.shape), where=count > 0)
+    mean = mean_a + delta * weight
+    m2 = m2_a + m2_b + delta ** 2 * count_a * weight
+    return count, mean, m2
+
+
+class StreamingImputer:
+    #
+    # running per-attribute and per-class aggregates for a live feed of rows
+    # fill() answers a row in constant time from the current means, update() folds rows in,
+    # merge() adds the state of another worker and save()/load() checkpoint it
+    def __init__(self, n_attributes, label_column=None):
+        self.n_attributes = n_attributes
+        self.label_column = label_column
+        empty = np.zeros(n_attributes)
+        self.totals = (empty.copy(), empty.copy(), empty.copy())
+        self.classes = {}
+
+    def update(self, rows):
+        rows = np.atleast_2d(np.asarray(rows, dtype=np.float64))
+        self.totals = combine_stats(self.totals, running_stats(rows))
+        if self.label_column is not None:
+            labels = rows[:, self.label_column]
+            for label in np.unique(labels[~np.isnan(labels)]):
+                batch = running_stats(rows[labels == label])
+                self.classes[label] = combine_stats(self.classes[label], batch) if label in self.classes else batch
+        return self
+
+    def means(self, label=None):
         #
-        # via mean method
-        avg = mean(contain_missing_data)
-        for element in missing_indexes:
-            contain_missing_data[element][0] = avg
-        distance = euclidean_distance(copy.copy(data), new_data=contain_missing_data, missing_indexes=missing_indexes)
-        mean_eucl.append(distance)
+        # class means where the class has observed values, overall means elsewhere (NaN if never seen)
+        count, mean, _ = self.totals
+        means = np.where(count > 0, mean, np.nan)
+        if label is not None and label in self.classes:
+            class_count, class_mean, _ = self.classes[label]
+            means = np.where(class_count > 0, class_mean, means)
+        return means
+
+    def variances(self, label=None):
         #
-        # via mean in same class
-        avg_by_class = {}
-        for element in missing_indexes:
-            if data[element][1] not in avg_by_class:
-                avg_by_class[data[element][1]] = 0
-        for label in avg_by_class:
-            temp_data = find_same_class_data(data=contain_missing_data, label=label)
-            class_avg = mean(temp_data)
-            avg_by_class[label] = round(class_avg, 2)
-        for item in missing_indexes:
-            contain_missing_data[item][0] = avg_by_class[contain_missing_data[item][1]]
-        distance = euclidean_distance(copy.copy(data), new_data=contain_missing_data, missing_indexes=missing_indexes)
-        mean_class_eucl.append(distance)
+        # sample variances with the same fallback as means : class values where the class has two
+        # observed values or more, overall values elsewhere (NaN below two observations)
+        count, _, m2 = self.totals
+        variances = np.divide(m2, count - 1, out=np.full(count.shape, np.nan), where=count > 1)
+        if label is not None and label in self.classes:
+            class_count, _, class_m2 = self.classes[label]
+            variances = np.where(class_count > 1, class_m2 / np.maximum(class_count - 1, 1), variances)
+        return variances
+
+    def fill(self, rows):
+        #
+        # fill the missing cells of rows in place, one lookup of the means per label present
+        rows = np.atleast_2d(rows)
+        missing = np.isnan(rows)
+        needs = missing.any(axis=1)
+        if self.label_column is None:
+            labels = np.full(len(rows), np.nan)
+        else:
+            labels = rows[:, self.label_column]
+        for label in np.unique(labels[needs]):
+            unlabeled = np.isnan(label)
+            group = needs & (np.isnan(labels) if unlabeled else labels == label)
+            cells = missing & group[:, None]
+            means = self.means(None if unlabeled else label)
+            rows[cells] = np.broadcast_to(means, rows.shape)[cells]
+        return rows
+
+    def process(self, rows):
         #
-        # via knn regression
-        contain_missing_data, missing_indexes = delete_alfa_percent(alfa, copy.copy(knn_data))
-        filled_data = via_knn_regression(copy.copy(contain_missing_data), [1, 2, 3, 4, 5, 6], 0)
-        distance = euclidean_distance(copy.copy(data), new_data=filled_data, missing_indexes=missing_indexes)
-        knn_eucl.append(distance)
-    plot_illustrate(mean_values=mean_eucl, mean_class_values=mean_class_eucl, knn_values=knn_eucl
-                    , alfa_percent=range(5, 85, 5))
-
-fill_missing()
+        # feed step : learn from the observed cells of rows, then fill their missing cells
+        # (a missing cell adds nothing to its own attribute, so the order does not bias the fill)
+        rows = np.array(rows, dtype=np.float64, ndmin=2)
+        self.update(rows)
+        return self.fill(rows)
+
+    def merge(self, other):
+        self.totals = combine_stats(self.totals, other.totals)
+        for label, stats in other.classes.items():
+            self.classes[label] = combine_stats(self.classes[label], stats) if label in self.classes else stats
+        return self
+
+    def save(self, path):
+        labels = sorted(self.classes)
+        class_stats = [np.array([self.classes[label][i] for label in labels]).reshape(-1, self.n_attributes)
+                       for i in range(3)]
+        with open(path, 'wb') as f:  # a file object keeps the path as given, np.savez would append .npz
+            np.savez(f, totals=np.array(self.totals), labels=np.array(labels, dtype=np.float64),
+                     class_count=class_stats[0], class_mean=class_stats[1], class_m2=class_stats[2],
+                     label_column=-1 if self.label_column is None else self.label_column)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as state:
+            label_column = int(state['label_column'])
+            imputer = cls(state['totals'].shape[1], None if label_column < 0 else label_column)
+            imputer.totals = tuple(state['totals'])
+            class_count, class_mean, class_m2 = state['class_count'], state['class_mean'], state['class_m2']
+            for i, label in enumerate(state['labels']):
+                imputer.classes[float(label)] = (class_count[i], class_mean[i], class_m2[i])
+        return imputer
+
+
+_worker_index_cache = {}
+KNN_ATTRIBUTES = [1, 2, 3, 4, 5, 6]
+LABEL_COLUMN = 7
+
+
+def run_trial(data, alfa, method, seed, index_cache=None):
+    #
+    # one draw : delete alfa percent of attribute 0, fill it back with method and score the filled cells
+    contain_missing_data, missing_indexes = delete_alfa_percent(alfa, data, rng=np.random.default_rng(seed))
+    if method == 'mean':
+        fill_by_mean(contain_missing_data)
+    elif method == 'class_mean':
+        fill_by_class_mean(contain_missing_data, data[:, LABEL_COLUMN])
+    elif method == 'knn':
+        via_knn_regression(contain_missing_data, KNN_ATTRIBUTES, 0, index_cache)
+    else:
+        raise ValueError("method should be 'mean', 'class_mean' or 'knn'")
+    scores = metrics.error_table(data[:, 0], contain_missing_data[:, 0], indexes=missing_indexes)
+    scores.update({'alfa': alfa, 'method': method})
+    return scores
+
+
+def _run_shared_trial(task):
+    alfa, method, trial, seed = task
+    scores = run_trial(pools.shared_array(), alfa, method, seed, _worker_index_cache)
+    scores['trial'] = trial
+    return scores
+
+
+def run_experiment(data, alfa_levels=range(5, 85, 5), methods=('mean', 'class_mean', 'knn'), trials=100,
+                   n_jobs=None, seed=None):
+    #
+    # every (alfa, method, trial) is an independent task with its own seed, spread over a process pool
+    # that shares one copy of data, returns a tidy table with one row per task
+    import pandas as pd
+    data = np.ascontiguousarray(data, dtype=np.float64)
+    seeds = np.random.SeedSequence(seed).spawn(len(alfa_levels) * len(methods) * trials)
+    tasks = [(alfa, method, trial, seeds[i])
+             for i, (alfa, method, trial) in enumerate((alfa, method, trial) for alfa in alfa_levels
+                                                       for method in methods for trial in range(trials))]
+    n_jobs = n_jobs or os.cpu_count()
+    with pools.shared_pool(data, n_jobs) as pool:
+        rows = list(pool.map(_run_shared_trial, tasks, chunksize=max(1, len(tasks) // (4 * n_jobs))))
+    return pd.DataFrame(rows, columns=['alfa', 'method', 'trial', 'l2', 'rmse', 'mae'])
+
+
+def summarize(table, measure='l2'):
+    #
+    # per (alfa, method) cell : mean, standard deviation, count and 95% confidence interval of measure
+    summary = table.groupby(['alfa', 'method'])[measure].agg(['mean', 'std', 'count']).reset_index()
+    margin = 1.96 * summary['std'].fillna(0) / np.sqrt(summary['count'])
+    summary['low'] = summary['mean'] - margin
+    summary['high'] = summary['mean'] + margin
+    return summary
+
+
+def missing_value_experiment(trials=100, n_jobs=None, seed=None, alfa_percent=range(5, 85, 5)):
+    #
+    # library entry point : per (alfa, method) statistics of the euclidean distance over trials draws
+    table = run_experiment(input_data_knn(), alfa_percent, trials=trials, n_jobs=n_jobs, seed=seed)
+    summary = summarize(table)
+    return {'trials': trials, 'cells': summary.to_dict(orient='records')}
+
+
+def plot_results(results, output_file=None):
+    means = {}
+    for cell in results['cells']:
+        means.setdefault(cell['method'], {})[cell['alfa']] = cell['mean']
+    alfa_percent = sorted(means['mean'])
+    plot_illustrate(mean_values=[means['mean'][alfa] for alfa in alfa_percent],
+                    mean_class_values=[means['class_mean'][alfa] for alfa in alfa_percent],
+                    knn_values=[means['knn'][alfa] for alfa in alfa_percent], alfa_percent=alfa_percent,
+                    output_file=output_file)
+
+
+def fill_missing(trials=100, n_jobs=None, seed=None, output_file=None):
+    results = missing_value_experiment(trials, n_jobs, seed)
+    plot_results(results, output_file)
+    return results
+
+
+def main(argv=None):
+    parser = cli.experiment_parser("Filling missing Area values of the seeds dataset by mean, class mean and KNN")
+    parser.add_argument('--trials', type=int, default=100)
+    parser.add_argument('--jobs', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+    results = missing_value_experiment(args.trials, args.jobs, args.seed)
+    cli.report(args, results, lambda output_file: plot_results(results, output_file))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,14 +3,18 @@ Internal Evaluation method :
 - Silhouette
 External Evaluation method :
 - Purity
+- Entropy, NMI and ARI (computed from the same contingency matrix)
 """
 from __future__ import print_function
 import os
-import pandas as pd
-import matplotlib.pyplot as plt
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
-print(__doc__)
+import sys
+import time
+import contextlib
+import numpy as np
+#
+# make the shared helpers of the repository root importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import cli, datasets, pools, results as result_cache
 
 
 def path_input_file():
@@ -18,33 +22,197 @@ def path_input_file():
     return file_dir+"/seeds.csv"
 
 
+def encode_labels(values):
+    #
+    # map arbitrary label values onto integer codes 0..n_values-1
+    uniques, codes = np.unique(np.asarray(values), return_inverse=True)
+    return codes.ravel(), len(uniques)
+
+
+def contingency_matrices(labels, clusters_batch):
+    #
+    # build one (cluster x class) count matrix for every clustering of the batch
+    # all matrices are zero padded up to the largest number of clusters
+    label_codes, n_labels = encode_labels(labels)
+    clusters_batch = np.atleast_2d(np.asarray(clusters_batch))
+    encoded = [encode_labels(clusters) for clusters in clusters_batch]
+    n_clusters = max(count for _, count in encoded)
+    tables = np.zeros((len(encoded), n_clusters, n_labels), dtype=np.int64)
+    for run, (cluster_codes, count) in enumerate(encoded):
+        flat = np.bincount(cluster_codes * n_labels + label_codes, minlength=count * n_labels)
+        tables[run, :count] = flat.reshape(count, n_labels)
+    return tables
+
+
+def _entropy(counts, axis):
+    #
+    # entropy (in bits) of count vectors along the given axis, 0 * log(0) is taken as 0
+    totals = counts.sum(axis=axis, keepdims=True)
+    p = np.divide(counts, totals, out=np.zeros(counts.shape), where=totals > 0)
+    logs = np.log2(p, out=np.zeros(p.shape), where=p > 0)
+    return -(p * logs).sum(axis=axis)
+
+
+def _pairs(counts):
+    return counts * (counts - 1) / 2.0
+
+
+def external_scores(labels, clusters_batch):
+    #
+    # purity, entropy, normalized mutual information and adjusted rand index
+    # are all derived from the same contingency matrices
+    # a 1-D clusters argument gives scalars, a 2-D batch gives one value per row
+    scores = scores_from_tables(contingency_matrices(labels, clusters_batch))
+    if np.asarray(clusters_batch).ndim == 1:
+        scores = {key: float(value[0]) for key, value in scores.items()}
+    return scores
+
+
+def scores_from_tables(tables):
+    tables = np.asarray(tables, dtype=np.float64)
+    n = tables.sum(axis=(1, 2))
+    cluster_sizes = tables.sum(axis=2)
+    class_sizes = tables.sum(axis=1)
+
+    purity = tables.max(axis=2).sum(axis=1) / n
+    entropy = (cluster_sizes / n[:, None] * _entropy(tables, axis=2)).sum(axis=1)
+
+    h_clusters = _entropy(cluster_sizes, axis=1)
+    h_classes = _entropy(class_sizes, axis=1)
+    mutual_info = h_classes - entropy
+    normalizer = (h_clusters + h_classes) / 2.0
+    nmi = np.divide(mutual_info, normalizer, out=np.ones(n.shape), where=normalizer > 0)
+
+    index = _pairs(tables).sum(axis=(1, 2))
+    sum_clusters = _pairs(cluster_sizes).sum(axis=1)
+    sum_classes = _pairs(class_sizes).sum(axis=1)
+    expected = sum_clusters * sum_classes / _pairs(n)
+    max_index = (sum_clusters + sum_classes) / 2.0
+    denominator = max_index - expected
+    ari = np.divide(index - expected, denominator, out=np.ones(n.shape), where=denominator != 0)
+
+    return {'purity': purity, 'entropy': entropy, 'nmi': nmi, 'ari': ari}
+
+
 def purity_measure(input_data, labels, clusters, k_value):
-    scores = {}
-    for index in range(0, k_value):
-        scores[index] = {}
-        for j in range(0, len(input_data)):
-            if clusters[j] == index:
-                if labels[j] in scores[index].keys():
-                    scores[index][labels[j]] += 1
-                else:
-                    scores[index][labels[j]] = 1
-    sum_values = 0
-    for index in range(0, k_value):
-        temp = 0
-        for label in scores[index].keys():
-            if scores[index][label] > temp:
-                temp = scores[index][label]
-        sum_values += temp
-    return sum_values / len(input_data)
-
-
-def silhouette_measure(clusterer, input_data):
-    cluster_labels = clusterer.fit_predict(input_data)
-    silhouette_avg = silhouette_score(input_data, cluster_labels)
-    return silhouette_avg
-
-
-def plot_illustrate(silhouette_values, purity_values, n_clusters):
+    return external_scores(labels, clusters)['purity']
+
+
+def silhouette_scores(input_data, labels_batch, sample_size=None, random_state=None, chunk_size=1024,
+                      dtype=np.float32):
+    #
+    # mean silhouette of every labeling in the batch, one pass over the pairwise distances
+    # each block of distance rows is computed once (in dtype) and shared by all labelings
+    # sample_size : score on a random subset of rows, same subset for every labeling
+    input_data = np.asarray(input_data)
+    labels_batch = np.atleast_2d(np.asarray(labels_batch))
+    if sample_size is not None and sample_size < len(input_data):
+        sample = np.random.RandomState(random_state).choice(len(input_data), sample_size, replace=False)
+        input_data, labels_batch = input_data[sample], labels_batch[:, sample]
+    x = (input_data - input_data.mean(axis=0)).astype(dtype)  # centering limits float32 cancellation
+    n_rows = len(x)
+    encoded = [encode_labels(labels) for labels in labels_batch]
+    offsets = np.cumsum([0] + [count for _, count in encoded])
+    #
+    # membership matrix of all labelings side by side, distances @ membership = per-cluster sums
+    membership = np.zeros((n_rows, offsets[-1]), dtype=dtype)
+    for (codes, _), offset in zip(encoded, offsets):
+        membership[np.arange(n_rows), offset + codes] = 1
+    sizes = membership.sum(axis=0)
+    squared_norms = (x * x).sum(axis=1)
+    totals = np.zeros(len(encoded))
+    for start in range(0, n_rows, chunk_size):
+        stop = min(start + chunk_size, n_rows)
+        rows = np.arange(stop - start)
+        distances = squared_norms[start:stop, None] - 2 * x[start:stop].dot(x.T) + squared_norms[None, :]
+        np.sqrt(np.maximum(distances, 0, out=distances), out=distances)
+        distances[rows, rows + start] = 0
+        sums = distances.dot(membership)
+        for run, ((codes, count), offset) in enumerate(zip(encoded, offsets)):
+            own = codes[start:stop]
+            cluster_sizes = sizes[offset:offset + count]
+            own_sizes = cluster_sizes[own]
+            means = sums[:, offset:offset + count] / cluster_sizes
+            intra = sums[rows, offset + own] / np.maximum(own_sizes - 1, 1)
+            means[rows, own] = np.inf
+            inter = means.min(axis=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                values = np.nan_to_num((inter - intra) / np.maximum(intra, inter))
+            values[own_sizes == 1] = 0  # a point alone in its cluster scores 0
+            totals[run] += values.sum()
+    return totals / n_rows
+
+
+def silhouette_measure(clusterer, input_data, sample_size=None):
+    #
+    # reuses the labels of the already fitted clusterer
+    return float(silhouette_scores(input_data, clusterer.labels_, sample_size=sample_size)[0])
+
+
+def timed_fit(km, input_data):
+    #
+    # fit km and keep the wall time of the fit in km.fit_time_ (seconds)
+    start = time.perf_counter()
+    km.fit(input_data)
+    km.fit_time_ = time.perf_counter() - start
+    return km
+
+
+def _fit_shared(k_value, random_state):
+    from sklearn.cluster import KMeans
+    return timed_fit(KMeans(n_clusters=k_value, random_state=random_state), pools.shared_array())
+
+
+def split_centers(km, input_data):
+    #
+    # centroids for k+1 : keep the k centroids and add the point farthest from its own
+    # centroid inside the cluster with the largest sum of squared errors
+    centers = km.cluster_centers_
+    errors = ((input_data - centers[km.labels_]) ** 2).sum(axis=1)
+    worst_cluster = np.bincount(km.labels_, weights=errors, minlength=len(centers)).argmax()
+    candidates = np.flatnonzero(km.labels_ == worst_cluster)
+    new_center = input_data[candidates[errors[candidates].argmax()]]
+    return np.vstack([centers, new_center])
+
+
+def kmeans_sweep(input_data, k_values, n_jobs=None, warm_start=False, random_state=None):
+    #
+    # fit KMeans for every k and return the fitted models in the order of k_values
+    # warm_start : chain the fits, k+1 starts from the k centroids plus one split (sequential)
+    # otherwise  : spread the k values over a process pool sharing one copy of the data
+    from sklearn.cluster import KMeans
+    k_values = list(k_values)
+    input_data = np.ascontiguousarray(input_data, dtype=np.float64)
+    if warm_start:
+        models = {}
+        km = None
+        for k_value in sorted(k_values):
+            if km is None or km.n_clusters != k_value - 1:
+                km = timed_fit(KMeans(n_clusters=k_value, random_state=random_state), input_data)
+            else:
+                init = split_centers(km, input_data)
+                km = timed_fit(KMeans(n_clusters=k_value, init=init, n_init=1, random_state=random_state),
+                               input_data)
+            models[k_value] = km
+        return [models[k_value] for k_value in k_values]
+    if n_jobs == 1:
+        return [timed_fit(KMeans(n_clusters=k_value, random_state=random_state), input_data)
+                for k_value in k_values]
+    with pools.shared_pool(input_data, n_jobs, limit_threads=True) as pool:
+        return fit_on_pool(pool, k_values, random_state)
+
+
+def fit_on_pool(pool, k_values, random_state=None):
+    #
+    # fit KMeans for every k on a pools.shared_pool of the data, models in the order of k_values
+    # the largest k values are the slowest, submit them first for a better balance
+    order = sorted(range(len(k_values)), key=lambda i: -k_values[i])
+    futures = {i: pool.submit(_fit_shared, k_values[i], random_state) for i in order}
+    return [futures[i].result() for i in range(len(k_values))]
+
+
+def plot_illustrate(silhouette_values, purity_values, n_clusters, output_file=None):
+    plt = cli.pyplot(output_file)
     # Create a subplot with 1 row and 2 columns
     fig, (ax1, ax2) = plt.subplots(1, 2)
     fig.set_size_inches(20, 7)
@@ -70,29 +238,275 @@ def plot_illustrate(silhouette_values, purity_values, n_clusters):
     ax2.grid()
 
     plt.suptitle("Silhouette and Purity evaluation for KMeans", fontsize=14, fontweight='bold', color='blue')
-    plt.show()
+    cli.finish(plt, output_file)
 
 
 def reading_data(label_stamp, label_index, attribute_range):
     #
-    # reading data from csv file
-    d = pd.read_csv(path_input_file(), header=0)
+    # reading data from the binary cache of the csv file
+    columns = datasets.load_columns(path_input_file())
+    names = list(columns)
     #
     # separate label column from input data
-    labels = d.drop(d.columns[attribute_range], axis=1, inplace=False)
+    labels = columns[label_stamp]
     # remove label column
-    d.drop(d.columns[label_index], axis=1, inplace=True)
-    # data.drop(data.columns[1], axis=1, inplace=True)
-    return d.as_matrix(), labels[label_stamp]
+    data = np.column_stack([columns[name] for i, name in enumerate(names) if i not in label_index])
+    return data, labels
+
+
+def reading_data_chunks(label_stamp, chunk_size, path=None):
+    #
+    # stream a seeds-format csv, yields (attribute matrix, label vector) per chunk
+    import pandas as pd
+    for d in pd.read_csv(path or path_input_file(), header=0, chunksize=chunk_size):
+        labels = d.pop(label_stamp)
+        yield d.values.astype(np.float64), labels.values
+
+
+def reservoir_update(reservoir, seen, chunk, random_state):
+    #
+    # keep a uniform random sample of all rows streamed so far (algorithm R, one chunk at a time)
+    size = len(reservoir)
+    fill = max(0, min(size - seen, len(chunk)))
+    reservoir[seen:seen + fill] = chunk[:fill]
+    positions = random_state.randint(0, np.arange(seen + fill, seen + len(chunk)) + 1)
+    keep = positions < size
+    reservoir[positions[keep]] = chunk[fill:][keep]
+    return seen + len(chunk)
+
+
+def accumulate_tables(tables, classes, clusters_batch, labels):
+    #
+    # add one chunk to the running contingency tables, classes grows as new labels show up
+    uniques, codes = np.unique(labels, return_inverse=True)
+    for value in uniques:
+        if value not in classes:
+            classes.append(value)
+    codes = np.array([classes.index(value) for value in uniques])[codes.ravel()]
+    n_clusters = tables.shape[1]
+    if tables.shape[2] < len(classes):
+        tables = np.pad(tables, ((0, 0), (0, 0), (0, len(classes) - tables.shape[2])), mode='constant')
+    for run, clusters in enumerate(clusters_batch):
+        flat = np.bincount(clusters * len(classes) + codes, minlength=n_clusters * len(classes))
+        tables[run] += flat.reshape(n_clusters, len(classes))
+    return tables
+
+
+def streaming_evaluation(k_values, path=None, chunk_size=100000, label_stamp="status", sample_size=20000,
+                         random_state=None):
+    #
+    # out-of-core version of the sweep, memory is bounded by chunk_size and sample_size
+    # pass 1 : partial_fit one MiniBatchKMeans per k and fill a reservoir sample for silhouette
+    # pass 2 : predict every chunk and accumulate the contingency tables for the external scores
+    from sklearn.cluster import MiniBatchKMeans
+    k_values = list(k_values)
+    rng = np.random.RandomState(random_state)
+    models = [MiniBatchKMeans(n_clusters=k_value, random_state=random_state) for k_value in k_values]
+    reservoir = None
+    seen = 0
+    pending = []
+    min_rows = max(k_values)  # the first partial_fit places the k centers, it needs at least k rows
+    for chunk, _ in reading_data_chunks(label_stamp, chunk_size, path):
+        if reservoir is None:
+            reservoir = np.empty((sample_size, chunk.shape[1]))
+        seen = reservoir_update(reservoir, seen, chunk, rng)
+        pending.append(chunk)
+        if sum(len(rows) for rows in pending) < min_rows:
+            continue
+        batch = np.concatenate(pending)
+        pending = []
+        min_rows = 1
+        for model in models:
+            model.partial_fit(batch)
+    if min_rows > 1:
+        raise ValueError("%d rows in %s, fewer than k = %d" % (seen, path or path_input_file(), max(k_values)))
+    sample = reservoir[:min(seen, sample_size)]
+
+    tables = np.zeros((len(models), max(k_values), 0), dtype=np.int64)
+    classes = []
+    for chunk, labels in reading_data_chunks(label_stamp, chunk_size, path):
+        tables = accumulate_tables(tables, classes, [model.predict(chunk) for model in models], labels)
+
+    silhouette = silhouette_scores(sample, np.array([model.predict(sample) for model in models]))
+    return models, silhouette, scores_from_tables(tables)
+
+
+def score_models(data, label, models, sample_size=20000, random_state=None):
+    #
+    # score a batch of fitted models in one call each, silhouette falls back to a sample on large inputs
+    # returns {'silhouette': [...], 'purity': [...], ...} in the order of models
+    cluster_labels = np.array([km.labels_ for km in models])
+    results = {'silhouette': silhouette_scores(data, cluster_labels, sample_size=sample_size,
+                                               random_state=random_state)}
+    results.update(external_scores(label, cluster_labels))
+    return results
+
+
+def evaluate_kmeans(k_values=range(2, 30), n_jobs=None, warm_start=False, sample_size=20000, random_state=None,
+                    cache=None):
+    #
+    # library entry point : silhouette and external scores of KMeans on the seeds data for every k
+    # cache : a common.results.ResultCache, the fits and scores of every k are reused across runs
+    # (only when random_state is set, unseeded fits are not reproducible)
+    data, label = reading_data(label_index=[7], label_stamp="status", attribute_range=range(0, 6))
+    k_values = list(k_values)
+    if cache is None or random_state is None:
+        models = kmeans_sweep(data, k_values, n_jobs=n_jobs, warm_start=warm_start, random_state=random_state)
+        results = {'k': k_values, 'fit_time': np.array([km.fit_time_ for km in models])}
+        results.update(score_models(data, label, models, sample_size, random_state))
+        return results
+
+    dataset = result_cache.data_hash(np.column_stack([data, encode_labels(label)[0]]))
+
+    def key(k_value):
+        # a warm started fit depends on the whole chain of k values it was fitted in
+        params = {'n_clusters': k_value, 'sample_size': sample_size,
+                  'warm_start': sorted(set(k_values)) if warm_start else None}
+        return result_cache.result_key(dataset, 'KMeans', params, random_state)
+
+    stored = dict((k_value, cache.get(key(k_value))) for k_value in k_values)
+    # entries written before fit times were recorded are refitted
+    missing = [k_value for k_value in k_values if stored[k_value] is None or 'fit_time' not in stored[k_value]]
+    if missing:
+        if warm_start:
+            # refit the same chain as the uncached path
+            missing = sorted(set(k_values))
+        models = kmeans_sweep(data, missing, n_jobs=n_jobs, warm_start=warm_start, random_state=random_state)
+        scores = score_models(data, label, models, sample_size, random_state)
+        for i, (k_value, km) in enumerate(zip(missing, models)):
+            stored[k_value] = {'labels': km.labels_, 'centers': km.cluster_centers_, 'inertia': km.inertia_,
+                               'fit_time': km.fit_time_}
+            stored[k_value].update((name, float(values[i])) for name, values in scores.items())
+            cache.put(key(k_value), stored[k_value], dataset, 'KMeans')
+    results = {'k': k_values}
+    for name in ('fit_time', 'silhouette', 'purity', 'entropy', 'nmi', 'ari'):
+        results[name] = np.array([stored[k_value][name] for k_value in k_values])
+    return results
+
+
+def search_k(input_data, labels, k_min=2, k_max=29, strategy='split', criterion='silhouette', patience=2,
+             tolerance=1e-3, n_jobs=None, sample_size=20000, random_state=None):
+    #
+    # pick k with a few fits instead of the whole sweep, the criterion is maximized
+    # (silhouette, purity, nmi or ari)
+    # strategy 'split'  : k grows one by one, every fit starts from the previous centroids plus a split of
+    #                     the worst cluster (see split_centers), and the search stops once the criterion has
+    #                     not improved by more than tolerance for patience consecutive k
+    # strategy 'coarse' : a coarse grid of k values is fitted in parallel, then the step is halved around
+    #                     the best k until it reaches 1
+    # returns the scores of the evaluated k (sorted, same keys as evaluate_kmeans) and the chosen 'best_k'
+    from sklearn.cluster import KMeans
+    input_data = np.ascontiguousarray(input_data, dtype=np.float64)
+    evaluated = {}
+
+    def evaluate(k_values, models):
+        scores = score_models(input_data, labels, models, sample_size, random_state)
+        for i, k_value in enumerate(k_values):
+            evaluated[k_value] = dict((key, float(values[i])) for key, values in scores.items())
+
+    def best():
+        return max(evaluated, key=lambda k_value: (evaluated[k_value][criterion], -k_value))
+
+    if strategy == 'split':
+        km = KMeans(n_clusters=k_min, random_state=random_state).fit(input_data)
+        best_value = -np.inf
+        stale = 0
+        while True:
+            evaluate([km.n_clusters], [km])
+            value = evaluated[km.n_clusters][criterion]
+            stale = 0 if value > best_value + tolerance else stale + 1
+            best_value = max(best_value, value)
+            if stale >= patience or km.n_clusters >= k_max:
+                break
+            init = split_centers(km, input_data)
+            km = KMeans(n_clusters=km.n_clusters + 1, init=init, n_init=1, random_state=random_state).fit(input_data)
+    elif strategy == 'coarse':
+        step = max(1, (k_max - k_min) // 4)
+        k_values = sorted(set(list(range(k_min, k_max + 1, step)) + [k_max]))
+        #
+        # one pool for all rounds, no more workers than the coarse grid can keep busy
+        n_jobs = min(n_jobs or os.cpu_count(), len(k_values))
+        with contextlib.ExitStack() as stack:
+            pool = None
+            if n_jobs > 1:
+                pool = stack.enter_context(pools.shared_pool(input_data, n_jobs, limit_threads=True))
+            while True:
+                k_values = [k_value for k_value in k_values if k_value not in evaluated]
+                if pool is not None and k_values:
+                    evaluate(k_values, fit_on_pool(pool, k_values, random_state))
+                elif k_values:
+                    evaluate(k_values, kmeans_sweep(input_data, k_values, n_jobs=1, random_state=random_state))
+                if step == 1:
+                    break
+                step = max(1, step // 2)
+                center = best()
+                k_values = [k_value for k_value in (center - step, center + step) if k_min <= k_value <= k_max]
+    else:
+        raise ValueError("unknown search strategy %r" % strategy)
+
+    k_values = sorted(evaluated)
+    results = {'k': k_values}
+    for key in evaluated[k_values[0]]:
+        results[key] = [evaluated[k_value][key] for k_value in k_values]
+    results['best_k'] = best()
+    results['criterion'] = criterion
+    return results
+
+
+def search_kmeans(k_min=2, k_max=29, strategy='split', criterion='silhouette', patience=2, n_jobs=None,
+                  sample_size=20000, random_state=None):
+    #
+    # library entry point : adaptive search of k on the seeds data, see search_k
+    data, label = reading_data(label_index=[7], label_stamp="status", attribute_range=range(0, 6))
+    return search_k(data, label, k_min, k_max, strategy=strategy, criterion=criterion, patience=patience,
+                    n_jobs=n_jobs, sample_size=sample_size, random_state=random_state)
+
 
+def main(argv=None):
+    parser = cli.experiment_parser("Silhouette and purity evaluation of KMeans on the seeds dataset")
+    parser.add_argument('--k-min', type=int, default=2)
+    parser.add_argument('--k-max', type=int, default=29)
+    parser.add_argument('--jobs', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--warm-start', action='store_true')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--search', choices=['split', 'coarse'],
+                        help="pick k adaptively with far fewer fits instead of fitting every k")
+    parser.add_argument('--criterion', choices=['silhouette', 'purity', 'nmi', 'ari'], default='silhouette')
+    parser.add_argument('--patience', type=int, default=2, help="k values without improvement before stopping")
+    parser.add_argument('--no-cache', action='store_true', help="refit every k instead of reusing cached fits")
+    parser.add_argument('--clear-cache', action='store_true', help="drop the cached KMeans fits first")
+    parser.add_argument('--stream', metavar='PATH',
+                        help="evaluate a seeds-format csv too large for memory, chunk by chunk (MiniBatchKMeans)")
+    parser.add_argument('--chunk-size', type=int, default=100000, help="rows per chunk of --stream")
+    args = parser.parse_args(argv)
+    if args.search and (args.warm_start or args.no_cache or args.clear_cache):
+        parser.error("--search fits its own chain of k values without the cache, it cannot be combined with "
+                     "--warm-start, --no-cache or --clear-cache")
+    if args.stream and (args.search or args.warm_start):
+        parser.error("--stream fits MiniBatchKMeans on every k, it cannot be combined with --search or --warm-start")
+    if not args.json:
+        print(__doc__)
+    cache = None if args.no_cache else result_cache.ResultCache()
+    if args.clear_cache and cache is not None:
+        cache.invalidate(algorithm='KMeans')
+    if args.stream:
+        k_values = list(range(args.k_min, args.k_max + 1))
+        _, silhouette, scores = streaming_evaluation(k_values, path=args.stream, chunk_size=args.chunk_size,
+                                                     random_state=args.seed)
+        results = {'k': k_values, 'silhouette': silhouette}
+        results.update(scores)
+    elif args.search:
+        results = search_kmeans(args.k_min, args.k_max, strategy=args.search, criterion=args.criterion,
+                                patience=args.patience, n_jobs=args.jobs, random_state=args.seed)
+        if not args.json:
+            print("best k = %d by %s, %d k values evaluated" % (results['best_k'], args.criterion, len(results['k'])))
+    else:
+        results = evaluate_kmeans(range(args.k_min, args.k_max + 1), n_jobs=args.jobs,
+                                  warm_start=args.warm_start, random_state=args.seed, cache=cache)
+    cli.report(args, results,
+               lambda output_file: plot_illustrate(results['silhouette'], results['purity'], results['k'],
+                                                   output_file))
 
-data, label = reading_data(label_index=[7], label_stamp="status", attribute_range=range(0, 6))
-c_clusters_ = range(2, 30)
-silhouette = []
-purity = []
-for k in c_clusters_:
-    km = KMeans(n_clusters=k).fit(data)
-    silhouette.append(silhouette_measure(clusterer=km, input_data=data))
-    purity.append(purity_measure(data, label, km.labels_, k))
 
-plot_illustrate(silhouette, purity, c_clusters_)
+if __name__ == '__main__':
+    main()
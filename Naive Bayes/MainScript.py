@@ -1,6 +1,16 @@
 import os
 import csv
 import sys
+import json
+import struct
+import asyncio
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+#
+# make the shared helpers of the repository root importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import cli, datasets
 
 
 def path_input_file():
@@ -13,17 +23,21 @@ def path_output_file():
     return file_dir + "/output.txt"
 
 
-def read_input_file():
-    data = []
+def path_model_file():
+    file_dir = os.path.dirname(__file__)
+    return file_dir + "/model.nbm"
+
+
+def read_input_columns():
+    #
+    # {attribute: column of category strings} from the raw text cache of the input file,
+    # so every cell is the category csv.reader gives on the --input path
     try:
-        with open(path_input_file(), 'rt', encoding='utf8') as f:
-            reader = csv.reader(f, delimiter=',', quotechar='\n')
-            for row in reader:
-                data.append(row)
+        columns = datasets.load_columns(path_input_file(), raw=True)
     except IOError:
         print("Wrong input path")
         sys.exit(0)
-    return data
+    return {name: np.asarray(values).astype(str) for name, values in columns.items()}
 
 
 def write_output_file(input_file):
@@ -39,59 +53,398 @@ def write_output_file(input_file):
     return
 
 
-def naive_bayes_method(input_data, label_identifier):
-    header_column = input_data[0]  # retrieve header column of input data
-    input_data.remove(input_data[0])
-    try:
-        label_idx = header_column.index(label_identifier)  # retrieve index of label column
-    except ValueError:
+def encode_column(values):
+    #
+    # integer-encode one categorical column, returns (categories, codes)
+    categories, codes = np.unique(values, return_inverse=True)
+    return categories, codes.ravel()
+
+
+def train_model(input_data, label_identifier):
+    header_column = list(input_data[0])  # retrieve header column of input data
+    table = np.array(input_data)[1:]
+    return train_columns(dict((att_title, table[:, i]) for i, att_title in enumerate(header_column)),
+                         label_identifier)
+
+
+def train_columns(columns, label_identifier):
+    #
+    # compact trained model : every category is encoded once and counts live in
+    # one (n_classes, n_values) array per attribute, filled by a single bincount
+    # columns = {attribute: column of values} in file order
+    if label_identifier not in columns:
         print('Label is not specified correctly')
         sys.exit(0)
-    class_dict = {}  # a data structure for saving output data
-    #
-    # first traversing data for count each class in label
-    #
-    for row in input_data:
-        class_title = row[label_idx]  # title of the class column
-        if class_title in class_dict.keys():
-            class_dict[class_title]['cnt'] += 1
-        else:
-            class_dict[class_title] = {}
-            class_dict[class_title]['cnt'] = 1
-    attribute_list = list(header_column)  # attribute list of our data
-    attribute_list.remove(label_identifier)
-    for key in class_dict.keys():
-        class_dict[key]['attributeList'] = {}
-        for attribute in attribute_list:
-            class_dict[key]['attributeList'][attribute] = {}
-    #
-    # second traversing data for count attributes of each class
-    #
-    for row in input_data:
-        cell_label = row[label_idx]
-        i = 0
-        for att_value in row:
-            att_title = header_column[i]
-            if att_title in attribute_list:
-                if att_value in class_dict[cell_label]['attributeList'][att_title].keys():
-                    class_dict[cell_label]['attributeList'][att_title][att_value] += 1
-                else:
-                    class_dict[cell_label]['attributeList'][att_title][att_value] = 1
-            i += 1
-    #
-    # determining probability of each class and its attributes
+    classes, class_codes = encode_column(columns[label_identifier])
+    model = {'label': label_identifier, 'classes': classes,
+             'class_counts': np.bincount(class_codes, minlength=len(classes)),
+             'attributes': [], 'values': [], 'counts': []}
+    for att_title, column in columns.items():
+        if att_title == label_identifier:
+            continue
+        values, codes = encode_column(column)
+        counts = np.bincount(class_codes * len(values) + codes, minlength=len(classes) * len(values))
+        model['attributes'].append(att_title)
+        model['values'].append(values)
+        model['counts'].append(counts.reshape(len(classes), len(values)))
+    return model
+
+
+def model_probabilities(model):
     #
+    # derive the P(...) dictionary from the count arrays, only observed (value, class) pairs are listed
     p = {}
-    cnt_rows = len(input_data)
-    for classifier in class_dict.keys():
-        p['class=' + classifier] = (float(class_dict[classifier]['cnt']) / float(cnt_rows))
-        for att_title in class_dict[classifier]['attributeList'].keys():
-            for att_option in class_dict[classifier]['attributeList'][att_title].keys():
-                p[att_title + '=' + att_option + ' | ' + 'class:' + classifier]\
-                    = float(class_dict[classifier]['attributeList'][att_title][att_option]) / float(
-                    class_dict[classifier]['cnt'])
+    class_counts = model['class_counts']
+    cnt_rows = float(class_counts.sum())
+    for c, classifier in enumerate(model['classes']):
+        p['class=' + classifier] = float(class_counts[c]) / cnt_rows
+        for att_title, values, counts in zip(model['attributes'], model['values'], model['counts']):
+            for v in np.flatnonzero(counts[c]):
+                p[att_title + '=' + values[v] + ' | ' + 'class:' + classifier]\
+                    = float(counts[c, v]) / float(class_counts[c])
     return p
 
-dataFile = read_input_file()
-probabilities = naive_bayes_method(dataFile, label_identifier='class')  # label column identifier
-write_output_file(probabilities)
+
+def naive_bayes_method(input_data, label_identifier):
+    return model_probabilities(train_model(input_data, label_identifier))
+
+
+def merge_models(first, second):
+    #
+    # counts are additive : align both models on the union of their categories and sum
+    if first is None:
+        return second
+    classes = np.union1d(first['classes'], second['classes'])
+    merged = {'label': first['label'], 'classes': classes,
+              'class_counts': np.zeros(len(classes), dtype=np.int64),
+              'attributes': list(first['attributes']), 'values': [], 'counts': []}
+    for model in (first, second):
+        merged['class_counts'][np.searchsorted(classes, model['classes'])] += model['class_counts']
+    for a, att_title in enumerate(first['attributes']):
+        b = second['attributes'].index(att_title)
+        values = np.union1d(first['values'][a], second['values'][b])
+        counts = np.zeros((len(classes), len(values)), dtype=np.int64)
+        for model, i in ((first, a), (second, b)):
+            rows = np.searchsorted(classes, model['classes'])
+            columns = np.searchsorted(values, model['values'][i])
+            counts[np.ix_(rows, columns)] += model['counts'][i]
+        merged['values'].append(values)
+        merged['counts'].append(counts)
+    return merged
+
+
+def shard_tasks(path, n_parts):
+    #
+    # a directory gives one task per csv shard, a single file is cut into n_parts byte ranges
+    # every task is (file, start, end) where start is already past the header line
+    if os.path.isdir(path):
+        files = sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.csv'))
+        return [(name, None, None) for name in files]
+    with open(path, 'rb') as f:
+        f.readline()
+        header_end = f.tell()
+    size = os.path.getsize(path)
+    step = max(1, (size - header_end) // n_parts + 1)
+    return [(path, start, min(start + step, size)) for start in range(header_end, size, step)]
+
+
+def read_shard_rows(path, start, end):
+    #
+    # stream the rows whose first byte lies in [start, end), returns (header, row generator)
+    # the generator opens the file itself, so nothing stays open when it is never consumed
+    with open(path, 'rb') as f:
+        header = next(csv.reader([f.readline().decode('utf8')], delimiter=',', quotechar='\n'))
+        if start is None:
+            start, end = f.tell(), os.path.getsize(path)
+
+    def lines():
+        with open(path, 'rb') as f:
+            f.seek(start - 1)
+            f.readline()  # skip the tail of a line owned by the previous range
+            while f.tell() < end:
+                line = f.readline()
+                if not line:
+                    break
+                yield line.decode('utf8')
+    return header, (row for row in csv.reader(lines(), delimiter=',', quotechar='\n') if row)
+
+
+def train_shard(task, label_identifier, chunk_rows):
+    #
+    # one worker : train on chunk_rows rows at a time and merge, memory is bounded by the chunk
+    header, rows = read_shard_rows(*task)
+    model = None
+    chunk = [header]
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) > chunk_rows:
+            model = merge_models(model, train_model(chunk, label_identifier))
+            chunk = [header]
+    if len(chunk) > 1:
+        model = merge_models(model, train_model(chunk, label_identifier))
+    return model
+
+
+def train_parallel(path, label_identifier, n_jobs=None, chunk_rows=100000):
+    #
+    # map : every shard is counted by a worker process, reduce : partial counts are merged
+    n_jobs = n_jobs or os.cpu_count()
+    tasks = shard_tasks(path, n_jobs)
+    model = None
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        for partial in pool.map(train_shard, tasks, [label_identifier] * len(tasks), [chunk_rows] * len(tasks)):
+            if partial is not None:
+                model = merge_models(model, partial)
+    return model
+
+
+def log_probabilities(model, alpha=1.0):
+    #
+    # log P(class) and Laplace smoothed log P(value | class) for every attribute
+    class_counts = model['class_counts'].astype(np.float64)
+    class_log_prior = np.log(class_counts / class_counts.sum())
+    att_log_probs = []
+    for counts in model['counts']:
+        smoothed = counts + alpha
+        att_log_probs.append(np.log(smoothed / smoothed.sum(axis=1, keepdims=True)))
+    return class_log_prior, att_log_probs
+
+
+#
+# binary model file layout :
+# magic | header length (uint64) | json header (names and category dictionaries) | 64-byte aligned arrays
+MODEL_MAGIC = b'NBMODEL1'
+_ALIGN = 64
+
+
+def _aligned(offset):
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def save_model(model, path=None, alpha=1.0):
+    class_log_prior, att_log_probs = log_probabilities(model, alpha)
+    arrays = [model['class_counts'], class_log_prior]
+    for counts, log_probs in zip(model['counts'], att_log_probs):
+        arrays += [counts, log_probs]
+    arrays = [np.ascontiguousarray(a, dtype='<i8' if a.dtype.kind in 'iu' else '<f8') for a in arrays]
+    layout = []
+    offset = 0
+    for a in arrays:
+        offset = _aligned(offset)
+        layout.append([offset, list(a.shape), a.dtype.str])
+        offset += a.nbytes
+    header = json.dumps({'label': model['label'], 'alpha': alpha,
+                         'classes': [str(c) for c in model['classes']],
+                         'attributes': list(model['attributes']),
+                         'values': [[str(v) for v in values] for values in model['values']],
+                         'arrays': layout}).encode('utf8')
+    data_start = _aligned(len(MODEL_MAGIC) + 8 + len(header))
+    with open(path or path_model_file(), 'wb') as f:
+        f.write(MODEL_MAGIC + struct.pack('<Q', len(header)) + header)
+        for a, (offset, _, _) in zip(arrays, layout):
+            f.seek(data_start + offset)
+            f.write(a.tobytes())
+    return
+
+
+def load_model(path=None):
+    #
+    # memory-map a model written by save_model, the arrays are read-only views into the file
+    buf = np.memmap(path or path_model_file(), dtype=np.uint8, mode='r')
+    if bytes(buf[:len(MODEL_MAGIC)]) != MODEL_MAGIC:
+        print("Wrong model file")
+        sys.exit(0)
+    header_len = struct.unpack('<Q', bytes(buf[len(MODEL_MAGIC):len(MODEL_MAGIC) + 8]))[0]
+    header_start = len(MODEL_MAGIC) + 8
+    header = json.loads(bytes(buf[header_start:header_start + header_len]).decode('utf8'))
+    data_start = _aligned(header_start + header_len)
+    arrays = [np.ndarray(tuple(shape), dtype=dtype, buffer=buf, offset=data_start + offset)
+              for offset, shape, dtype in header['arrays']]
+    return {'label': header['label'], 'alpha': header['alpha'],
+            'classes': np.array(header['classes']),
+            'class_counts': arrays[0], 'class_log_prior': arrays[1],
+            'attributes': header['attributes'],
+            'values': [np.array(values) for values in header['values']],
+            'counts': arrays[2::2], 'log_probabilities': arrays[3::2]}
+
+
+def export_text(model):
+    #
+    # human readable export, same content as the original output.txt
+    write_output_file(model_probabilities(model))
+
+
+def _log_tables(model, alpha):
+    if 'log_probabilities' in model:
+        return model['class_log_prior'], model['log_probabilities'], model['alpha']
+    class_log_prior, att_log_probs = log_probabilities(model, alpha)
+    return class_log_prior, att_log_probs, alpha
+
+
+def row_table(model, rows):
+    #
+    # rows as a (n_rows, n_attributes) string array, ValueError when they are not rows of the model's width
+    table = np.array(rows, dtype=str)
+    if table.ndim != 2 or table.shape[1] != len(model['attributes']):
+        raise ValueError("expected rows of %d values (%s)" % (len(model['attributes']),
+                                                              ', '.join(model['attributes'])))
+    return table
+
+
+def predict_log_joint(model, rows, alpha=1.0):
+    #
+    # log P(class) + sum of log P(value | class) for a batch of rows given in model['attributes'] order
+    # values never seen in training get the Laplace estimate alpha / (class count + alpha * n_values)
+    class_log_prior, att_log_probs, alpha = _log_tables(model, alpha)
+    table = row_table(model, rows)
+    joint = np.tile(class_log_prior, (len(table), 1))
+    class_counts = model['class_counts'].astype(np.float64)
+    for i, (values, log_probs) in enumerate(zip(model['values'], att_log_probs)):
+        column = table[:, i]
+        codes = np.minimum(np.searchsorted(values, column), len(values) - 1)
+        seen = values[codes] == column
+        joint[seen] += log_probs[:, codes[seen]].T
+        if not seen.all():
+            joint[~seen] += np.log(alpha) - np.log(class_counts + alpha * len(values))
+    return joint
+
+
+def predict_proba(model, rows, alpha=1.0):
+    joint = predict_log_joint(model, rows, alpha)
+    joint -= joint.max(axis=1, keepdims=True)
+    proba = np.exp(joint)
+    return proba / proba.sum(axis=1, keepdims=True)
+
+
+def predict(model, rows, alpha=1.0):
+    return model['classes'][predict_log_joint(model, rows, alpha).argmax(axis=1)]
+
+
+class MicroBatcher:
+    #
+    # coalesce concurrent requests into one predict_proba call of at most max_batch_size rows,
+    # waiting no longer than max_wait seconds for a batch to fill up
+    def __init__(self, model, max_batch_size=256, max_wait=0.002):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+
+    async def submit(self, rows):
+        #
+        # a malformed request is rejected here, so it never fails the other requests of its batch
+        table = row_table(self.model, rows)
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((table, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            size = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+                size += len(batch[-1][0])
+            rows = np.concatenate([table for table, _ in batch])
+            try:
+                proba = await loop.run_in_executor(None, predict_proba, self.model, rows)
+            except Exception as error:
+                for _, future in batch:
+                    future.set_exception(error)
+                continue
+            start = 0
+            for request_rows, future in batch:
+                future.set_result(proba[start:start + len(request_rows)])
+                start += len(request_rows)
+
+
+async def _serve(model, path, host, port, max_batch_size, max_wait):
+    batcher = MicroBatcher(model, max_batch_size, max_wait)
+    classes = [str(c) for c in model['classes']]
+
+    async def handle(reader, writer):
+        #
+        # one json object per line : {"rows": [[value, ...], ...]}
+        # answered by {"classes": [...], "predictions": [...], "probabilities": [[...], ...]}
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                proba = await batcher.submit(json.loads(line.decode('utf8'))['rows'])
+                reply = {'classes': classes,
+                         'predictions': [classes[i] for i in proba.argmax(axis=1)],
+                         'probabilities': proba.tolist()}
+            except Exception as error:
+                reply = {'error': repr(error)}
+            writer.write(json.dumps(reply).encode('utf8') + b'\n')
+            await writer.drain()
+        writer.close()
+
+    worker = asyncio.ensure_future(batcher.run())
+    if path is not None:
+        server = await asyncio.start_unix_server(handle, path=path)
+    else:
+        server = await asyncio.start_server(handle, host=host, port=port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        worker.cancel()
+
+
+def serve(model, path=None, host='127.0.0.1', port=8765, max_batch_size=256, max_wait=0.002):
+    #
+    # local scoring server, listens on a unix socket when path is given, otherwise on host:port
+    asyncio.run(_serve(model, path, host, port, max_batch_size, max_wait))
+
+
+def train(label_identifier='class', path=None, n_jobs=None):
+    #
+    # library entry point : train on the input file, store the binary model and the text export
+    # path : a csv file or a directory of csv shards, counted in parallel worker processes (see train_parallel)
+    if path is None:
+        trained_model = train_columns(read_input_columns(), label_identifier)
+    else:
+        if not os.path.exists(path):
+            print("Wrong input path")
+            sys.exit(0)
+        trained_model = train_parallel(path, label_identifier, n_jobs=n_jobs)
+    save_model(trained_model)
+    export_text(trained_model)
+    return trained_model
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Naive Bayes on the car evaluation dataset")
+    parser.add_argument('command', nargs='?', choices=['train', 'serve'], default='train')
+    parser.add_argument('socket', nargs='?', help="unix socket path for serve (default: tcp on --port)")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-batch-size', type=int, default=256, help="serve : most rows scored in one call")
+    parser.add_argument('--max-wait', type=float, default=0.002,
+                        help="serve : seconds a request may wait for its batch to fill up")
+    parser.add_argument('--input', help="train : csv file or directory of csv shards, trained in parallel "
+                                        "(default: the bundled car.csv)")
+    parser.add_argument('--jobs', type=int, default=None, help="train : worker processes for --input")
+    parser.add_argument('--json', help="train : also write the probabilities as json to this file ('-' for stdout)")
+    args = parser.parse_args(argv)
+    if args.command == 'serve':
+        serve(load_model(), path=args.socket, port=args.port, max_batch_size=args.max_batch_size,
+              max_wait=args.max_wait)
+        return
+    probabilities = model_probabilities(train(label_identifier='class',  # label column identifier
+                                              path=args.input, n_jobs=args.jobs))
+    if args.json:
+        cli.write_json(probabilities, args.json)
+
+
+if __name__ == '__main__':
+    main()
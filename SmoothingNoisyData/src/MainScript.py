@@ -4,12 +4,14 @@ chosen attribute = Area
 smoothing noisy data via windows mean
 """
 import os
-import copy
+import sys
 import math
-import random
+import heapq
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
+#
+# make the shared helpers of the repository root importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from common import cli, datasets, metrics
 
 
 def path_input_file():
@@ -19,50 +21,194 @@ def path_input_file():
 
 def input_data():
     #
-    # reading data from csv file
-    data = pd.read_csv(path_input_file(), header=0, usecols=["Area"])
-    return data.as_matrix()
+    # reading data from the binary cache of the csv file
+    data, _ = datasets.load_matrix(path_input_file(), usecols=["Area"])
+    return data
 
 
-def make_alfa_percent_noisy(alfa, data):
+def make_noisy_trials(data, alfa_levels, trials, rng):
+    #
+    # one row per (alfa, trial) : alfa percent of the items get gaussian noise (std 1) added
+    # rows are grouped by alfa, trials rows for the first level, then the next level ...
+    data = np.asarray(data, dtype=np.float64).ravel()
     data_len = len(data)
-    sample_count = int(data_len * (alfa/100))
-    random_indexes = random.sample(range(0, data_len-1), sample_count)
-    noisy_items = {x: np.random.normal(data[x]) for x in random_indexes}
-    for key, value in noisy_items.items():
-        data[key] = value
+    noisy = np.tile(data, (len(alfa_levels) * trials, 1))
+    for level, alfa in enumerate(alfa_levels):
+        sample_count = int(data_len * (alfa/100))
+        rows = np.arange(level * trials, (level + 1) * trials)
+        random_indexes = rng.random((trials, data_len - 1)).argsort(axis=1)[:, :sample_count]
+        noisy[rows[:, None], random_indexes] += rng.standard_normal((trials, sample_count))
+    return noisy
+
+
+def prefix_sums(data):
+    #
+    # sums[..., i] = data[..., 0] + ... + data[..., i-1], so any strip sum is a difference of two entries
+    data = np.asarray(data, dtype=np.float64)
+    return np.concatenate((np.zeros(data.shape[:-1] + (1,)), np.cumsum(data, axis=-1)), axis=-1)
+
+
+def smooth_noisy_data(data, windows_count, sums=None):
+    #
+    # 1-D series, or a 2-D array smoothed row by row
+    data = np.array(data, dtype=np.float64)
+    if data.ndim != 2:
+        data = data.ravel()
+    _len = data.shape[-1]
+    item_count = int((_len - windows_count)/(windows_count+1))
+    if item_count <= 0:
+        return data  # windows would be empty, nothing to average
+    if sums is None:
+        sums = prefix_sums(data)
+    #
+    # every (item_count+1)-th item is replaced by the mean of the item_count items on each side
+    boundaries = np.arange(item_count, _len, item_count + 1)
+    left = sums[..., boundaries] - sums[..., boundaries - item_count]
+    right = sums[..., np.minimum(boundaries + item_count + 1, _len)] - sums[..., boundaries + 1]
+    data[..., boundaries] = (left + right) / (2*item_count)
     return data
 
 
-def euclidean_distance(data, new_data):
-    sum_values = 0
-    for element in range(0, len(data)):
-        sum_values += (abs((data[element] - new_data[element])))**2
-    return math.sqrt(sum_values)
+def bin_edges(data, windows_count, binning):
+    #
+    # index boundaries of the bins over sorted data
+    # equal_depth : every bin holds the same number of items (+-1)
+    # equal_width : every bin covers the same value range
+    _len = len(data)
+    if binning == 'equal_depth':
+        return np.linspace(0, _len, windows_count + 1).astype(np.int64)
+    if binning == 'equal_width':
+        limits = np.linspace(data[0], data[-1], windows_count + 1)[1:-1]
+        return np.concatenate(([0], np.searchsorted(data, limits, side='right'), [_len]))
+    raise ValueError("binning should be 'equal_depth' or 'equal_width'")
+
+
+class RollingMedian:
+    #
+    # median of a sliding window in O(log w) per step : two heaps with lazy deletion
+    # low is a max-heap (stored negated) with the smaller half, high a min-heap with the larger half
+    # entries are tagged with their position so items that left the window are dropped when they surface
+    def __init__(self):
+        self.low = []
+        self.high = []
+        self.in_low = {}
+        self.low_count = 0
+        self.high_count = 0
+        self.start = 0
+        self.stop = 0
+
+    def _prune(self):
+        while self.low and self.low[0][1] < self.start:
+            heapq.heappop(self.low)
+        while self.high and self.high[0][1] < self.start:
+            heapq.heappop(self.high)
+
+    def _rebalance(self):
+        while self.low_count > self.high_count + 1:
+            self._prune()
+            value, index = heapq.heappop(self.low)
+            heapq.heappush(self.high, (-value, index))
+            self.in_low[index] = False
+            self.low_count -= 1
+            self.high_count += 1
+        while self.high_count > self.low_count:
+            self._prune()
+            value, index = heapq.heappop(self.high)
+            heapq.heappush(self.low, (-value, index))
+            self.in_low[index] = True
+            self.high_count -= 1
+            self.low_count += 1
+        self._prune()
+        #
+        # stale entries buried inside a heap are swept out once they outnumber the live ones
+        if len(self.low) + len(self.high) > 2 * (self.low_count + self.high_count) + 32:
+            self.low = [item for item in self.low if item[1] >= self.start]
+            self.high = [item for item in self.high if item[1] >= self.start]
+            heapq.heapify(self.low)
+            heapq.heapify(self.high)
+
+    def push(self, value):
+        index = self.stop
+        self.stop += 1
+        if not self.low or value <= -self.low[0][0]:
+            heapq.heappush(self.low, (-value, index))
+            self.in_low[index] = True
+            self.low_count += 1
+        else:
+            heapq.heappush(self.high, (value, index))
+            self.in_low[index] = False
+            self.high_count += 1
+        self._rebalance()
+
+    def pop(self):
+        #
+        # remove the oldest item of the window
+        if self.in_low.pop(self.start):
+            self.low_count -= 1
+        else:
+            self.high_count -= 1
+        self.start += 1
+        self._rebalance()
 
+    def median(self):
+        if self.low_count > self.high_count:
+            return -self.low[0][0]
+        return (-self.low[0][0] + self.high[0][0]) / 2.0
 
-def smooth_noisy_data(data, windows_count):
+
+def rolling_median(data, window):
+    #
+    # centered sliding-window median, the window is truncated at both ends of the series
+    data = np.asarray(data, dtype=np.float64).ravel().tolist()
     _len = len(data)
-    item_count = int((_len - windows_count)/(windows_count+1))
-    mean_counter = 0
-    sum_strip = 0
-    for index in range(0, _len):
-        if mean_counter == item_count:
-            for i in range(index+1, index+item_count+1):
-                if i < _len:
-                    sum_strip += data[i]
-                else:
-                    break
-            data[index] = (sum_strip / (2*item_count))
-            mean_counter = 0
-            sum_strip = 0
+    half = window // 2
+    smoothed = np.empty(_len)
+    medians = RollingMedian()
+    for value in data[:half]:
+        medians.push(value)
+    for index in range(_len):
+        if index + half < _len:
+            medians.push(data[index + half])
+        if index - half - 1 >= 0:
+            medians.pop()
+        smoothed[index] = medians.median()
+    return smoothed
+
+
+def smooth_by_bins(data, windows_counts, binning='equal_depth', method='mean'):
+    #
+    # smooth data for several window counts, returns {windows_count: smoothed array}
+    # mean       : every item is replaced by the mean of its bin
+    # median     : every item is replaced by the median of its bin
+    # boundaries : every item is replaced by the closer of its bin minimum and maximum
+    # the three above expect data sorted ascending and share one pass of prefix sums
+    # rolling_median : sliding median over the series as given, window = len(data) // windows_count
+    data = np.asarray(data, dtype=np.float64).ravel()
+    if method == 'rolling_median':
+        return {windows_count: rolling_median(data, max(1, len(data) // windows_count))
+                for windows_count in windows_counts}
+    if method not in ('mean', 'median', 'boundaries'):
+        raise ValueError("method should be 'mean', 'median', 'boundaries' or 'rolling_median'")
+    sums = prefix_sums(data) if method == 'mean' else None
+    smoothed = {}
+    for windows_count in windows_counts:
+        edges = bin_edges(data, windows_count, binning)
+        sizes = np.diff(edges)
+        starts, stops, sizes = edges[:-1][sizes > 0], edges[1:][sizes > 0], sizes[sizes > 0]
+        if method == 'mean':
+            smoothed[windows_count] = np.repeat((sums[stops] - sums[starts]) / sizes, sizes)
+        elif method == 'median':
+            medians = (data[starts + (sizes - 1) // 2] + data[starts + sizes // 2]) / 2
+            smoothed[windows_count] = np.repeat(medians, sizes)
         else:
-            mean_counter += 1
-            sum_strip += data[index]
-    return data
+            lower = np.repeat(data[starts], sizes)
+            upper = np.repeat(data[stops - 1], sizes)
+            smoothed[windows_count] = np.where(data - lower <= upper - data, lower, upper)
+    return smoothed
 
 
-def plot_illustrate(twenty_win_values, forty_win_values, eighty_win_values, alfa_percent):
+def plot_illustrate(twenty_win_values, forty_win_values, eighty_win_values, alfa_percent, output_file=None):
+    plt = cli.pyplot(output_file)
     # Create a subplot with 1 row and 3 columns
     fig, (ax1, ax2, ax3) = plt.subplots(1, 3)
     fig.set_size_inches(5, 5)
@@ -98,22 +244,86 @@ def plot_illustrate(twenty_win_values, forty_win_values, eighty_win_values, alfa
     ax3.grid()
 
     plt.suptitle("Smoothing the noisy data via below windows number", fontsize=14, fontweight='bold', color='blue')
-    plt.show()
+    cli.finish(plt, output_file)
+
+
+def smooth_trials(noisy, windows_counts, method='window_mean', binning='equal_depth'):
+    #
+    # {windows_count: smoothed copy of noisy} for a 2-D array of sorted noisy trials
+    # window_mean : smooth_noisy_data on all rows at once from one pass of prefix sums
+    # rolling_median : the windows of rolling_median for all rows at once, NaN padding truncates them at the ends
+    # the other smooth_by_bins methods (mean, median, boundaries) run row by row
+    if method == 'window_mean':
+        sums = prefix_sums(noisy)
+        return dict((windows_count, smooth_noisy_data(noisy, windows_count, sums))
+                    for windows_count in windows_counts)
+    if method == 'rolling_median':
+        smoothed = {}
+        for windows_count in windows_counts:
+            half = max(1, noisy.shape[1] // windows_count) // 2
+            padded = np.pad(noisy, ((0, 0), (half, half)), mode='constant', constant_values=np.nan)
+            windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * half + 1, axis=1)
+            smoothed[windows_count] = np.nanmedian(windows, axis=2)
+        return smoothed
+    rows = [smooth_by_bins(row, windows_counts, binning, method) for row in noisy]
+    return dict((windows_count, np.array([row[windows_count] for row in rows])) for windows_count in windows_counts)
+
+
+def noise_experiment(data, alfa_levels, windows_counts, trials=1000, seed=None, method='window_mean',
+                     binning='equal_depth'):
+    #
+    # Monte Carlo grid : every (alfa, windows count) cell is scored on the same trials noisy copies
+    # method, binning : smoother of the noisy copies, see smooth_trials
+    # returns {windows_count: {'mean': [...], 'low': [...], 'high': [...]}} over alfa_levels,
+    # low/high being the 95% confidence interval of the mean euclidean distance
+    alfa_levels = list(alfa_levels)
+    rng = np.random.default_rng(seed)
+    noisy = np.sort(make_noisy_trials(data, alfa_levels, trials, rng), axis=1)
+    smoothed_trials = smooth_trials(noisy, windows_counts, method, binning)
+    results = {}
+    for windows_count in windows_counts:
+        smoothed = smoothed_trials[windows_count]
+        distances = metrics.euclidean_distance(noisy, smoothed).reshape(len(alfa_levels), trials)
+        means = distances.mean(axis=1)
+        margin = 1.96 * distances.std(axis=1, ddof=1) / math.sqrt(trials) if trials > 1 else 0
+        results[windows_count] = {'mean': means, 'low': means - margin, 'high': means + margin}
+    return results
+
+
+def smoothing_experiment(trials=1000, seed=None, windows_counts=(20, 40, 80), alfa_percent=range(5, 85, 5),
+                         method='window_mean', binning='equal_depth'):
+    #
+    # library entry point : mean distance and confidence interval per (alfa, windows count)
+    eucl_dists = noise_experiment(input_data(), alfa_percent, windows_counts, trials=trials, seed=seed,
+                                  method=method, binning=binning)
+    return {'alfa': list(alfa_percent), 'trials': trials, 'method': method, 'binning': binning,
+            'windows': {str(key): value for key, value in eucl_dists.items()}}
+
+
+def do_algorithm(trials=1000, seed=None, output_file=None):
+    results = smoothing_experiment(trials, seed)
+    plot_results(results, output_file)
+    return results
+
+
+def plot_results(results, output_file=None):
+    windows = results['windows']
+    plot_illustrate(twenty_win_values=windows['20']['mean'], forty_win_values=windows['40']['mean'],
+                    eighty_win_values=windows['80']['mean'], alfa_percent=results['alfa'], output_file=output_file)
 
 
-def do_algorithm():
-    data = input_data()
-    eucl_dists = {20: [], 40: [], 80: []}
-    for alfa in range(5, 85, 5):
-        for key, value in eucl_dists.items():
-            noisy = make_alfa_percent_noisy(alfa, copy.copy(data))
-            flatten_noisy = [x[0] for x in noisy]
-            flatten_noisy = sorted(flatten_noisy)
-            smoothed = smooth_noisy_data(copy.copy(flatten_noisy), key)
-            distance = euclidean_distance(data=copy.copy(flatten_noisy), new_data=copy.copy(smoothed))
-            eucl_dists[key].append(distance)
-    plot_illustrate(twenty_win_values=eucl_dists[20], forty_win_values=eucl_dists[40], eighty_win_values=eucl_dists[80]
-                    , alfa_percent=range(5, 85, 5))
+def main(argv=None):
+    parser = cli.experiment_parser("Smoothing the noisy Area attribute of the seeds dataset via windows mean")
+    parser.add_argument('--trials', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--method', choices=['window_mean', 'mean', 'median', 'boundaries', 'rolling_median'],
+                        default='window_mean', help="smoother, window_mean or one of smooth_by_bins")
+    parser.add_argument('--binning', choices=['equal_depth', 'equal_width'], default='equal_depth',
+                        help="bins of the mean, median and boundaries methods")
+    args = parser.parse_args(argv)
+    results = smoothing_experiment(args.trials, args.seed, method=args.method, binning=args.binning)
+    cli.report(args, results, lambda output_file: plot_results(results, output_file))
 
 
-do_algorithm()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,3 @@
+"""
+Helpers shared by the scripts of this repository
+"""
@@ -0,0 +1,64 @@
+"""
+Command line and plotting helpers for the experiment scripts
+
+matplotlib is only imported when a figure is drawn, and with the
+non-interactive Agg backend when the figure goes to a file.
+"""
+import sys
+import json
+import argparse
+import numpy as np
+
+
+def experiment_parser(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--no-plot', action='store_true', help="do not draw any figure")
+    parser.add_argument('--plot-file', help="save the figure to this file instead of showing it")
+    parser.add_argument('--json', help="write the results as json to this file ('-' for stdout)")
+    return parser
+
+
+def _plain(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, range):
+        return list(value)
+    raise TypeError("not json serializable : %r" % type(value))
+
+
+def write_json(results, path):
+    text = json.dumps(results, default=_plain, indent=1)
+    if path == '-':
+        sys.stdout.write(text + '\n')
+    else:
+        with open(path, 'wt', encoding='utf8') as f:
+            f.write(text)
+
+
+def pyplot(output_file=None):
+    import matplotlib
+    if output_file is not None:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def finish(plt, output_file=None):
+    #
+    # show the figure, or write it to output_file and release it
+    if output_file is None:
+        plt.show()
+    else:
+        plt.savefig(output_file)
+        plt.close('all')
+
+
+def report(args, results, plot):
+    #
+    # common tail of every script : json output and/or the figure
+    if args.json:
+        write_json(results, args.json)
+    if not args.no_plot:
+        plot(args.plot_file)
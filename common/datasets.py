@@ -0,0 +1,121 @@
+"""
+Binary column cache for the csv inputs
+
+The first load of a csv parses it once and writes every column as a .npy
+file into "<file>.npcache" next to it. Later loads memory-map those files.
+The cache is rebuilt when the source changes: size and mtime are checked on
+every load, the content hash only when they disagree (so a touched but
+unchanged file is not parsed again).
+
+In raw mode ("<file>.raw.npcache") every cell is kept as the text written in
+the file: no type inference and no missing-value markers, for inputs whose
+values are categories.
+"""
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+
+CACHE_SUFFIX = '.npcache'
+
+
+def cache_dir(path, raw=False):
+    return path + ('.raw' if raw else '') + CACHE_SUFFIX
+
+
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_meta(path, raw=False):
+    try:
+        with open(os.path.join(cache_dir(path, raw), 'meta.json'), 'rt', encoding='utf8') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def _write_meta(path, meta, raw=False):
+    with open(os.path.join(cache_dir(path, raw), 'meta.json'), 'wt', encoding='utf8') as f:
+        json.dump(meta, f)
+
+
+def build_cache(path, raw=False):
+    #
+    # parse the csv once and store one .npy file per column, text columns as fixed width unicode
+    # raw : every column is text exactly as written (pandas neither guesses types nor reads NA markers)
+    import pandas as pd
+    directory = cache_dir(path, raw)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    stat = os.stat(path)
+    if raw:
+        frame = pd.read_csv(path, header=0, dtype=str, keep_default_na=False)
+    else:
+        frame = pd.read_csv(path, header=0)
+    files = []
+    for i, name in enumerate(frame.columns):
+        values = np.asarray(frame[name])
+        if values.dtype.kind not in 'biufcmM':
+            values = values.astype(str)
+        files.append('%d.npy' % i)
+        np.save(os.path.join(directory, files[-1]), values)
+    meta = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': file_hash(path),
+            'columns': [str(name) for name in frame.columns], 'files': files}
+    _write_meta(path, meta, raw)  # written last, a cache without meta.json is never used
+    return meta
+
+
+def cached_meta(path, raw=False):
+    #
+    # metadata of a valid cache for path, rebuilding it when the source changed
+    meta = _read_meta(path, raw)
+    stat = os.stat(path)
+    if meta is not None and (meta['size'], meta['mtime_ns']) != (stat.st_size, stat.st_mtime_ns):
+        if meta['size'] == stat.st_size and meta['sha1'] == file_hash(path):
+            meta['mtime_ns'] = stat.st_mtime_ns
+            _write_meta(path, meta, raw)
+        else:
+            meta = None
+    if meta is None:
+        meta = build_cache(path, raw)
+    return meta
+
+
+def invalidate(path):
+    for raw in (False, True):
+        shutil.rmtree(cache_dir(path, raw), ignore_errors=True)
+
+
+def load_columns(path, usecols=None, dtype=None, raw=False):
+    #
+    # {column name: array} memory-mapped from the cache, in file order
+    # usecols : names or positions of the columns to load, dtype : e.g. np.float32 to down-cast
+    # numeric columns (this makes an in-memory copy of them)
+    # raw : text columns holding the cells as written, see build_cache
+    meta = cached_meta(path, raw)
+    names = meta['columns']
+    if usecols is None:
+        selected = range(len(names))
+    else:
+        wanted = [names.index(col) if isinstance(col, str) else int(col) for col in usecols]
+        selected = sorted(set(wanted))
+    columns = {}
+    for i in selected:
+        values = np.load(os.path.join(cache_dir(path, raw), meta['files'][i]), mmap_mode='r')
+        if dtype is not None and values.dtype.kind in 'biuf':
+            values = values.astype(dtype)
+        columns[names[i]] = values
+    return columns
+
+
+def load_matrix(path, usecols=None, dtype=None):
+    #
+    # the selected columns stacked into one (rows, columns) array
+    columns = load_columns(path, usecols, dtype)
+    return np.column_stack(list(columns.values())), list(columns)
@@ -0,0 +1,48 @@
+"""
+Vectorized distance and error measures
+
+reference and trials are arrays over the last axis, trials may hold one
+series per row so many trials are scored against one reference in a single
+call. indexes restricts every measure to those positions (masked variants).
+A 1-D input gives a float, a batch gives one value per row.
+"""
+import numpy as np
+
+
+def differences(reference, trials, indexes=None, dtype=np.float64):
+    reference = np.asarray(reference, dtype=dtype)
+    trials = np.asarray(trials, dtype=dtype)
+    if indexes is not None:
+        indexes = np.asarray(indexes, dtype=np.int64)
+        reference = reference[..., indexes]
+        trials = trials[..., indexes]
+    return trials - reference
+
+
+def _result(values):
+    return float(values) if np.ndim(values) == 0 else values
+
+
+def euclidean_distance(reference, trials, indexes=None, dtype=np.float64):
+    diff = differences(reference, trials, indexes, dtype)
+    return _result(np.sqrt(np.einsum('...i,...i->...', diff, diff)))
+
+
+def rmse(reference, trials, indexes=None, dtype=np.float64):
+    diff = differences(reference, trials, indexes, dtype)
+    return _result(np.sqrt(np.einsum('...i,...i->...', diff, diff) / max(diff.shape[-1], 1)))
+
+
+def mae(reference, trials, indexes=None, dtype=np.float64):
+    diff = differences(reference, trials, indexes, dtype)
+    return _result(np.abs(diff).mean(axis=-1))
+
+
+def error_table(reference, trials, indexes=None, dtype=np.float64):
+    #
+    # all measures from one pass of differences
+    diff = differences(reference, trials, indexes, dtype)
+    squared = np.einsum('...i,...i->...', diff, diff)
+    return {'l2': _result(np.sqrt(squared)),
+            'rmse': _result(np.sqrt(squared / max(diff.shape[-1], 1))),
+            'mae': _result(np.abs(diff).mean(axis=-1))}
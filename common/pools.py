@@ -0,0 +1,51 @@
+"""
+Process pools sharing one copy of a numpy array
+
+The parent copies the array once into a shared memory block, every worker
+maps that block when it starts instead of unpickling its own copy. Task
+functions read it back with shared_array().
+"""
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+_shared = None
+
+
+def _attach(name, shape, dtype, limit_threads):
+    #
+    # pool initializer, runs once in every worker
+    global _shared
+    block = shared_memory.SharedMemory(name=name)
+    _shared = (block, np.ndarray(shape, dtype=dtype, buffer=block.buf))
+    if limit_threads:
+        try:
+            from threadpoolctl import threadpool_limits
+            threadpool_limits(1)  # one BLAS/OpenMP thread per worker, the pool provides the parallelism
+        except ImportError:
+            pass
+
+
+def shared_array():
+    #
+    # inside a worker of shared_pool : the array shared by the parent
+    return _shared[1]
+
+
+@contextlib.contextmanager
+def shared_pool(data, n_jobs=None, limit_threads=False):
+    #
+    # yields a ProcessPoolExecutor whose workers see data through shared_array()
+    # the shared block is released when the pool is done
+    # limit_threads : one BLAS/OpenMP thread per worker (needs threadpoolctl)
+    data = np.ascontiguousarray(data)
+    block = shared_memory.SharedMemory(create=True, size=max(1, data.nbytes))
+    try:
+        np.ndarray(data.shape, dtype=data.dtype, buffer=block.buf)[:] = data
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_attach,
+                                 initargs=(block.name, data.shape, data.dtype, limit_threads)) as pool:
+            yield pool
+    finally:
+        block.close()
+        block.unlink()
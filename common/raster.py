@@ -0,0 +1,81 @@
+"""
+Density rasterization of large labeled point clouds
+
+Instead of one marker per point, points are binned into a fixed resolution
+2-D histogram and drawn as one image. Every cell blends the colors of its
+labels weighted by their counts, its opacity grows with the number of
+points in it. Cost and memory of drawing depend on the resolution, not on
+the number of points.
+"""
+import numpy as np
+
+
+def bounding_extent(points):
+    #
+    # (x min, x max, y min, y max) of the points
+    return (float(points[:, 0].min()), float(points[:, 0].max()),
+            float(points[:, 1].min()), float(points[:, 1].max()))
+
+
+def cell_indexes(points, bins, extent):
+    #
+    # flat cell index (row along y, column along x) of every point, -1 outside of extent
+    x0, x1, y0, y1 = extent
+    column = np.floor((points[:, 0] - x0) / ((x1 - x0) or 1) * bins).astype(np.int64)
+    row = np.floor((points[:, 1] - y0) / ((y1 - y0) or 1) * bins).astype(np.int64)
+    #
+    # points on the upper border belong to the last cell
+    column[points[:, 0] == x1] = bins - 1
+    row[points[:, 1] == y1] = bins - 1
+    cells = row * bins + column
+    cells[(column < 0) | (column >= bins) | (row < 0) | (row >= bins)] = -1
+    return cells
+
+
+def label_histogram(points, labels, label_colors, bins=400, extent=None):
+    #
+    # per cell point counts and color sums of the labels, both of shape (bins, bins[, 3])
+    # @label_colors = rgb(a) color table indexed by the label values (negative labels index from the end)
+    # @extent = (x min, x max, y min, y max), the bounding box of points when None
+    points = np.asarray(points)
+    if extent is None:
+        extent = bounding_extent(points)
+    cells = cell_indexes(points, bins, extent)
+    inside = cells >= 0
+    cells = cells[inside]
+    point_colors = np.asarray(label_colors, dtype=np.float64)[np.asarray(labels)[inside], :3]
+    counts = np.bincount(cells, minlength=bins * bins).reshape(bins, bins)
+    color_sums = np.stack([np.bincount(cells, weights=point_colors[:, channel], minlength=bins * bins)
+                           for channel in range(3)], axis=1).reshape(bins, bins, 3)
+    return counts, color_sums
+
+
+def density_image(counts, color_sums, log_scale=True):
+    #
+    # rgba image of a label histogram : mean color of the points in each cell and an opacity
+    # proportional to the (log) count, empty cells are transparent
+    rgb = color_sums / np.maximum(counts, 1)[..., None]
+    top = counts.max()
+    if top == 0:
+        alpha = np.zeros(counts.shape)
+    elif log_scale:
+        alpha = np.log1p(counts) / np.log1p(top)
+    else:
+        alpha = counts / float(top)
+    return np.dstack([rgb, alpha])
+
+
+def rasterize(points, labels, label_colors, bins=400, extent=None, log_scale=True):
+    #
+    # returns (rgba image, extent) ready for draw
+    points = np.asarray(points)
+    if extent is None:
+        extent = bounding_extent(points)
+    counts, color_sums = label_histogram(points, labels, label_colors, bins, extent)
+    return density_image(counts, color_sums, log_scale), extent
+
+
+def draw(ax, image, extent):
+    #
+    # one image artist whatever the number of points behind it
+    return ax.imshow(image, extent=extent, origin='lower', interpolation='nearest', aspect='auto')
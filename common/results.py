@@ -0,0 +1,151 @@
+"""
+Persistent cache of fitted results
+
+Results (labels, centers, timings, scores) are stored as one uncompressed
+.npz file per entry, named by the sha1 of the entry key: the content hash of
+the dataset, the algorithm name, its parameters and the seed. Integer arrays
+are down-cast to the smallest type holding their values. Every hit refreshes
+the modification time of its file, and once the files exceed max_bytes the
+least recently used ones are deleted.
+"""
+import os
+import json
+import hashlib
+import numpy as np
+
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.resultcache')
+DEFAULT_MAX_BYTES = 512 << 20
+
+
+def data_hash(data):
+    #
+    # content hash of an array, shape and dtype included
+    data = np.ascontiguousarray(data)
+    digest = hashlib.sha1(('%s%s' % (data.dtype.str, data.shape)).encode('utf8'))
+    digest.update(data.view(np.uint8).ravel() if data.size else b'')
+    return digest.hexdigest()
+
+
+def result_key(dataset, algorithm, params=None, seed=None):
+    #
+    # @dataset = content hash of the data (see data_hash)
+    # @params = json serializable parameters of the algorithm
+    text = json.dumps([dataset, algorithm, params or {}, seed], sort_keys=True, default=str)
+    return hashlib.sha1(text.encode('utf8')).hexdigest()
+
+
+def _compact(values):
+    values = np.asarray(values)
+    if values.dtype.kind in 'iu' and values.size:
+        return values.astype(np.result_type(np.min_scalar_type(values.min()), np.min_scalar_type(values.max())))
+    return values
+
+
+class ResultCache:
+    #
+    # size bounded on-disk cache of result dictionaries {name: array, number, string or None}
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or DEFAULT_DIR
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def get(self, key):
+        #
+        # the stored dictionary, None on a miss
+        path = self._path(key)
+        try:
+            with np.load(path) as stored:
+                result = {}
+                for name in stored.files:
+                    if name.startswith('__'):
+                        continue
+                    values = stored[name]
+                    if values.dtype.kind in 'iu':
+                        values = values.astype(np.intp)
+                    result[name] = values.item() if values.ndim == 0 else values
+                for name in stored['__none__']:
+                    result[str(name)] = None
+        except (IOError, ValueError, KeyError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass  # evicted by another process meanwhile, the result read is still valid
+        return result
+
+    def put(self, key, result, dataset=None, algorithm=None):
+        #
+        # store result under key, dataset and algorithm are kept for invalidate
+        arrays = dict((name, _compact(value)) for name, value in result.items() if value is not None)
+        arrays['__none__'] = np.array([name for name, value in result.items() if value is None], dtype=str)
+        arrays['__dataset__'] = np.array(dataset or '')
+        arrays['__algorithm__'] = np.array(algorithm or '')
+        temporary = self._path(key) + '.%d.tmp' % os.getpid()
+        with open(temporary, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(temporary, self._path(key))  # readers never see a half written entry
+        self.evict()
+
+    def memoize(self, dataset, algorithm, params, seed, compute):
+        #
+        # the cached result of (dataset, algorithm, params, seed), computed by compute() and stored on a miss
+        key = result_key(dataset, algorithm, params, seed)
+        result = self.get(key)
+        if result is None:
+            result = compute()
+            self.put(key, result, dataset, algorithm)
+        return result
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, path))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        #
+        # delete least recently used entries until the cache fits in max_bytes
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def invalidate(self, dataset=None, algorithm=None):
+        #
+        # delete the entries of a dataset hash and/or an algorithm, everything when both are None
+        # returns the number of deleted entries
+        removed = 0
+        for _, _, path in self._entries():
+            if dataset is not None or algorithm is not None:
+                try:
+                    with np.load(path) as stored:
+                        owner = str(stored['__dataset__']), str(stored['__algorithm__'])
+                except (IOError, ValueError, KeyError):
+                    owner = None
+                if owner is not None and (dataset is not None and owner[0] != dataset or
+                                          algorithm is not None and owner[1] != algorithm):
+                    continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            removed += 1
+        return removed